@@ -0,0 +1,215 @@
+import json
+import os
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from backend.config import CATALOG_DIR
+
+
+def load_framework_files(directory: str = CATALOG_DIR) -> List[Dict[str, Any]]:
+    """
+    Read every framework catalog (*.json) in a directory.
+
+    Frameworks are returned in their "order", then by file name. Unreadable
+    files are logged and skipped.
+    """
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+    except OSError as e:
+        print(f"WARNING: Control catalog directory not readable: {e}")
+        return []
+
+    frameworks = []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            with open(path, "r") as f:
+                frameworks.append(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"ERROR loading framework catalog {path}: {e}")
+    return sorted(frameworks, key=lambda data: data.get("order", 0))
+
+
+PRIORITY_ORDER = {"Critical": 0, "High": 1, "Medium": 2, "Low": 3}
+DEFAULT_PRIORITY = "Medium"
+
+# Fallback remediation text for catalog entries without a "remediation" field,
+# chosen by keywords in the control name.
+DEFAULT_DETAILS = [
+    (("access control",), "Establish clear access control policies defining user roles, permissions, and the principle of least privilege."),
+    (("mfa", "multi-factor"), "Deploy multi-factor authentication for all user accounts, especially for privileged access."),
+    (("incident",), "Develop a comprehensive incident response plan with clear roles, responsibilities, and escalation procedures."),
+    (("audit",), "Implement centralized logging and monitoring with regular audit log reviews."),
+    (("encryption",), "Implement encryption for data at rest and in transit using industry-standard algorithms."),
+    (("backup", "recovery"), "Establish regular backup procedures and test recovery processes periodically."),
+    (("consent",), "Implement a consent management system to track and manage user consent for data processing."),
+    (("retention",), "Define clear data retention periods and automatic deletion procedures for different data categories."),
+]
+
+
+def default_details(control_name: str) -> str:
+    name = control_name.lower()
+    for keywords, details in DEFAULT_DETAILS:
+        if any(keyword in name for keyword in keywords):
+            return details
+    return f"Review industry best practices for {control_name} and implement appropriate controls."
+
+
+class Control:
+    """A catalog control with its recommendation precomputed at load time."""
+
+    __slots__ = ("framework", "index", "bit", "id", "name", "category", "keywords",
+                 "label", "priority", "priority_rank", "recommendation")
+
+    def __init__(self, framework: "Framework", index: int, entry: Dict[str, Any]):
+        self.framework = framework
+        # Position in the catalog; results store one status bit per control
+        self.index = index
+        self.bit = 1 << index
+        self.id = entry["id"]
+        self.name = entry["name"]
+        self.category = entry.get("category", "")
+        self.keywords = tuple(keyword.lower() for keyword in entry.get("keywords", []))
+        self.label = f"{framework.id} {self.id}: {self.name}"
+
+        self.priority = entry.get("priority", DEFAULT_PRIORITY)
+        if self.priority not in PRIORITY_ORDER:
+            self.priority = DEFAULT_PRIORITY
+        self.priority_rank = PRIORITY_ORDER[self.priority]
+
+        self.recommendation = {
+            "control": self.label,
+            "priority": self.priority,
+            "recommendation": f"Implement {self.name}",
+            "details": entry.get("remediation") or default_details(self.name),
+        }
+
+
+class KeywordMatcher:
+    """
+    Keyword matcher for the controls of one framework, built at load time.
+
+    Keywords shared by several controls are searched for once per text, and
+    only until each control has its first hit.
+    """
+
+    __slots__ = ("keywords", "control_keywords")
+
+    def __init__(self, controls: List[Control]):
+        positions: Dict[str, int] = {}
+        for control in controls:
+            for keyword in control.keywords:
+                positions.setdefault(keyword, len(positions))
+        self.keywords = tuple(positions)
+        # Each control with the positions of its keywords, in catalog order
+        self.control_keywords = tuple(
+            (control, tuple(positions[keyword] for keyword in control.keywords))
+            for control in controls
+        )
+
+    def match(self, text_lower: str) -> Tuple[int, Dict[int, Tuple[str, int]]]:
+        """
+        Match lowercased text against the framework's controls.
+
+        Returns the bits of the controls present, and the first matching
+        keyword of each with its offset in the text.
+        """
+        offsets: List[Optional[int]] = [None] * len(self.keywords)
+        present = 0
+        hits = {}
+        for control, keyword_positions in self.control_keywords:
+            for position in keyword_positions:
+                offset = offsets[position]
+                if offset is None:
+                    offset = offsets[position] = text_lower.find(self.keywords[position])
+                if offset >= 0:
+                    present |= control.bit
+                    hits[control.index] = (self.keywords[position], offset)
+                    break
+        return present, hits
+
+
+class Framework:
+    """A compliance framework loaded from one catalog file."""
+
+    def __init__(self, data: Dict[str, Any]):
+        # The id is the label prefix of its controls, e.g. "NIST"
+        self.id = data["id"]
+        self.name = data.get("name", self.id)
+        self.version = data.get("version", "")
+        # Evaluated when a request does not select frameworks
+        self.default = bool(data.get("default", False))
+        # Key in the "compliance_details" response and the id field of its records
+        self.details_key = data.get("details_key", self.id.lower())
+        self.id_field = data.get("id_field", "control_id")
+        self.controls: List[Control] = []
+        # Control ids are unique within a framework, not across frameworks
+        self.by_id: Dict[str, Control] = {}
+        # Bits of all controls of the framework
+        self.mask = 0
+        self.matcher = KeywordMatcher([])
+
+    def add(self, control: Control):
+        self.controls.append(control)
+        self.by_id[control.id] = control
+        self.mask |= control.bit
+
+    def compile(self):
+        self.matcher = KeywordMatcher(self.controls)
+
+
+class ControlCatalog:
+    """All frameworks and their controls; controls are identified by (framework id, control id)."""
+
+    def __init__(self, framework_files: Iterable[Dict[str, Any]]):
+        self.controls: List[Control] = []
+        self.frameworks: Dict[str, Framework] = {}
+
+        for data in framework_files:
+            framework = Framework(data)
+            if framework.id in self.frameworks:
+                print(f"WARNING: Duplicate framework {framework.id} in control catalog, skipped")
+                continue
+            for entry in data.get("controls", []):
+                if entry["id"] in framework.by_id:
+                    print(f"WARNING: Duplicate control id {entry['id']} in {framework.id}, skipped")
+                    continue
+                control = Control(framework, len(self.controls), entry)
+                self.controls.append(control)
+                framework.add(control)
+            framework.compile()
+            self.frameworks[framework.id] = framework
+
+        self.all_mask = (1 << len(self.controls)) - 1
+        self.default_frameworks = tuple(
+            framework for framework in self.frameworks.values() if framework.default
+        ) or tuple(self.frameworks.values())
+
+    def __len__(self) -> int:
+        return len(self.controls)
+
+    def select(self, framework_ids: Optional[Iterable[str]] = None) -> Tuple[Framework, ...]:
+        """
+        Frameworks selected by id (case-insensitive), in catalog order.
+
+        No ids select the default frameworks. Raises ValueError for an
+        unknown id.
+        """
+        if not framework_ids:
+            return self.default_frameworks
+        by_key = {framework.id.lower(): framework for framework in self.frameworks.values()}
+        selected = set()
+        for framework_id in framework_ids:
+            framework = by_key.get(framework_id.strip().lower())
+            if framework is None:
+                raise ValueError(
+                    f"Unknown framework '{framework_id}'. Available: {', '.join(self.frameworks)}"
+                )
+            selected.add(framework.id)
+        return tuple(framework for framework in self.frameworks.values() if framework.id in selected)
+
+
+@lru_cache(maxsize=None)
+def load_catalog() -> ControlCatalog:
+    """Build the control catalog once per process from the files in CATALOG_DIR."""
+    return ControlCatalog(load_framework_files())
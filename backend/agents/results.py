@@ -0,0 +1,107 @@
+from enum import IntFlag
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from backend.agents.catalog import Control, ControlCatalog, Framework
+
+
+class Status(IntFlag):
+    """Control status; combine flags to select several statuses at once."""
+    PRESENT = 1
+    MISSING = 2
+    ANY = PRESENT | MISSING
+
+    @property
+    def label(self) -> str:
+        return "Present" if self is Status.PRESENT else "Missing"
+
+
+def _popcount(value: int) -> int:
+    return bin(value).count("1")
+
+
+class ComplianceResult:
+    """
+    Outcome of checking one policy against the selected frameworks.
+
+    Per-control records are the shared catalog Control objects; the result
+    itself only stores a bitset with one bit set per control found in the
+    policy, plus the keyword that matched each present control and its
+    character offset in the policy text. Controls of frameworks that were
+    not selected are not part of the result.
+    """
+
+    __slots__ = ("catalog", "frameworks", "mask", "present", "score", "hits")
+
+    def __init__(self, catalog: ControlCatalog, present: int,
+                 hits: Optional[Dict[int, Tuple[str, int]]] = None,
+                 frameworks: Optional[Tuple[Framework, ...]] = None):
+        self.catalog = catalog
+        self.frameworks = catalog.default_frameworks if frameworks is None else frameworks
+        # Bits of all controls of the selected frameworks
+        self.mask = 0
+        for framework in self.frameworks:
+            self.mask |= framework.mask
+        self.present = present & self.mask
+        # Control index -> (keyword, offset) of its first keyword hit
+        self.hits = hits or {}
+        self.score = self._score(self.mask)
+
+    def _score(self, mask: int) -> int:
+        total = _popcount(mask)
+        return int((_popcount(self.present & mask) / total) * 100) if total else 0
+
+    def framework_score(self, framework: Framework) -> int:
+        """Score within one of the selected frameworks."""
+        return self._score(framework.mask)
+
+    def status(self, control: Control) -> Status:
+        return Status.PRESENT if self.present & control.bit else Status.MISSING
+
+    def hit(self, control: Control) -> Optional[Tuple[str, int]]:
+        """The (keyword, offset) that made a control present, if recorded."""
+        return self.hits.get(control.index)
+
+    def controls(self, status: Status = Status.ANY,
+                 framework: Optional[Framework] = None) -> Iterator[Control]:
+        """Iterate the selected frameworks' controls with the given status, in catalog order."""
+        frameworks = self.frameworks if framework is None else (framework,)
+        for selected in frameworks:
+            for control in selected.controls:
+                if self.status(control) & status:
+                    yield control
+
+    def labels(self, status: Status, limit: Optional[int] = None) -> List[str]:
+        """Display labels such as "NIST AC-1: Access Control Policy and Procedures"."""
+        labels = []
+        for control in self.controls(status):
+            if limit is not None and len(labels) >= limit:
+                break
+            labels.append(control.label)
+        return labels
+
+    def count(self, status: Status, framework: Optional[Framework] = None) -> int:
+        mask = self.mask if framework is None else framework.mask
+        if status == Status.ANY:
+            return _popcount(mask)
+        bits = self.present if status == Status.PRESENT else ~self.present
+        return _popcount(bits & mask)
+
+    def compliance_details(self) -> Dict[str, List[Dict[str, str]]]:
+        """Per-framework control records in the API's compliance_details format."""
+        return {
+            framework.details_key: [
+                {framework.id_field: control.id, "name": control.name, "status": self.status(control).label}
+                for control in framework.controls
+            ]
+            for framework in self.frameworks
+        }
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Present/total control counts per framework."""
+        return {
+            framework.id: {
+                "present": self.count(Status.PRESENT, framework),
+                "total": self.count(Status.ANY, framework),
+            }
+            for framework in self.frameworks
+        }
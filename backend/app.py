@@ -1,24 +1,46 @@
-from fastapi import FastAPI, UploadFile, Form, HTTPException
+from fastapi import FastAPI, UploadFile, Form, HTTPException, Header, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response, JSONResponse, PlainTextResponse, FileResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Tuple
+from datetime import datetime
 import os
+import re
 import asyncio
-import json
-import sys
-import io
 import threading
-import queue
+import hashlib
+import math
 import time
-from backend.crew_orchestrator import get_policy_crew
+import uuid
+import contextlib
 from backend.masumi_payment import verify_payment
-from backend.config import MAX_FILE_SIZE, ALLOWED_EXTENSIONS
+from backend.state_store import get_store
+from backend.agents.catalog import load_catalog
+from backend.compliance_index import INDEX_STATUSES
+from backend.history import GRANULARITIES, history_key, query_history, to_timestamp
+from backend.profiling import RequestProfiler, is_admin, sampled
+from backend.reports import REPORT_MEDIA_TYPES, artifact_path, enqueue_report, get_report, report_url, start_renderer
+from backend.json_codec import FastJSONResponse
+from backend.http_cache import result_id, result_etag, etag_matches, not_modified, precondition_failed, json_result_response
+from backend.jobs import AnalysisJob, jobs, fail_lost_job, stream_job, stream_stored_job
+from backend.scheduler import RateLimited, scheduler, tenant_id, tenant_weight, check_rate_limit
+from backend.cancellation import AnalysisCancelled, CLIENT_DISCONNECTED, DEADLINE_EXCEEDED
+from backend.config import (
+    MAX_FILE_SIZE,
+    ALLOWED_EXTENSIONS,
+    RESULT_CACHE_TTL,
+    WARMUP_AI_MODULES,
+    RENDER_REPORTS,
+    REPORT_POLL_SECONDS,
+    ANALYSIS_DEADLINE_SECONDS
+)
 
 app = FastAPI(
     title="Live Data Analysis by Masumi (ADA)",
     description="AI-Driven Cybersecurity Policy Analyzer with On-Chain Monetization",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # Enable CORS
@@ -30,9 +52,214 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Set once the agent/LLM modules have finished importing
+ai_modules_loaded = threading.Event()
+
+def get_policy_crew(api_key: Optional[str] = None, provider: str = "openai"):
+    """
+    Build the analysis crew.
+    
+    CrewAI and the LLM client libraries take seconds to import, so they are
+    only loaded on the first analysis instead of at process start.
+    """
+    from backend.crew_orchestrator import get_policy_crew as build_policy_crew
+    ai_modules_loaded.set()
+    return build_policy_crew(api_key=api_key, provider=provider)
+
+def warm_up_ai_modules():
+    """Import the agent/LLM modules ahead of the first analysis."""
+    import backend.crew_orchestrator  # noqa: F401
+    ai_modules_loaded.set()
+
+@app.on_event("startup")
+async def start_warm_up():
+    if WARMUP_AI_MODULES and not ai_modules_loaded.is_set():
+        threading.Thread(target=warm_up_ai_modules, name="ai-warm-up", daemon=True).start()
+
+@app.on_event("startup")
+async def start_report_renderer():
+    if RENDER_REPORTS:
+        start_renderer()
+
+# Keep proxies from buffering or caching event streams
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# A document_id (SHA-256 of the policy text) as used in history keys
+DOCUMENT_ID_PATTERN = re.compile(r"[0-9a-f]{64}")
+# Shorter account keys would be easy to guess, exposing the account's history
+ACCOUNT_KEY_MIN_LENGTH = 16
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    retry_after = max(1, math.ceil(exc.retry_after))
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.message, "retry_after": retry_after},
+        headers={"Retry-After": str(retry_after)}
+    )
+
 class PaymentVerification(BaseModel):
     payment_id: str
 
+def result_cache_key(content: bytes, premium: bool, provider: str, frameworks: Tuple[str, ...]) -> str:
+    """Key analysis results by document content, tier, LLM provider and selected frameworks."""
+    digest = hashlib.sha256(content).hexdigest()
+    tier = "premium" if premium else "free"
+    return f"analysis:{digest}:{tier}:{provider}:{'+'.join(frameworks)}"
+
+def parse_frameworks(frameworks: Optional[str]) -> Tuple[str, ...]:
+    """
+    Framework ids selected by a comma-separated form field, in catalog order.
+    
+    An empty field selects the default frameworks; raises ValueError for an
+    unknown framework.
+    """
+    requested = [item for item in (frameworks or "").split(",") if item.strip()]
+    return tuple(framework.id for framework in load_catalog().select(requested))
+
+def result_url(cache_key: str) -> str:
+    return f"/results/{result_id(cache_key)}"
+
+def result_reference_key(result_id: str) -> str:
+    """Cache key under which /results/{id} finds the result cache key."""
+    return f"result:{result_id}"
+
+def cache_result(cache_key: str, result: dict):
+    """Cache an analysis result, also under its /results/{id} URL."""
+    store = get_store()
+    store.cache_set(cache_key, result, RESULT_CACHE_TTL)
+    store.cache_set(result_reference_key(result_id(cache_key)), {"key": cache_key}, RESULT_CACHE_TTL)
+
+def cached_result(result_id: str) -> Optional[dict]:
+    reference = get_store().cache_get(result_reference_key(result_id))
+    return get_store().cache_get(reference["key"]) if reference is not None else None
+
+def effective_provider(api_key: Optional[str], llm_provider: str) -> str:
+    """The provider actually used: custom keys select a provider, otherwise the OpenAI default."""
+    return llm_provider if api_key and llm_provider else "openai"
+
+def request_tenant(request: Request, verified_payment_id: Optional[str] = None) -> str:
+    return tenant_id(request.client.host if request.client else None, verified_payment_id)
+
+def history_owner(request: Request) -> str:
+    """
+    Whose compliance history a request records in and reads from.
+    
+    A client that sends X-Account-Key (a secret it keeps, at least
+    ACCOUNT_KEY_MIN_LENGTH characters) has one history across payments and
+    IP addresses; anyone else has the history of the client IP. Payments
+    never key history: every premium analysis is paid separately.
+    """
+    account_key = request.headers.get("x-account-key")
+    if not account_key:
+        return request_tenant(request)
+    if len(account_key) < ACCOUNT_KEY_MIN_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"X-Account-Key must be at least {ACCOUNT_KEY_MIN_LENGTH} characters"
+        )
+    return "account:" + hashlib.sha256(account_key.encode()).hexdigest()[:32]
+
+def header_flag(value: Optional[str]) -> bool:
+    """Parse a boolean request header such as X-Profile: 1 / true / yes / on."""
+    return (value or "").strip().lower() in ("1", "true", "yes", "on")
+
+def profile_request(request: Request) -> Optional[str]:
+    """
+    Return a profile id if an admin asked to profile this analysis.
+    
+    Admins ask for a profile with X-Profile: 1 and X-Admin-Token; such a
+    request always runs a fresh analysis. Analyses sampled at
+    PROFILE_SAMPLE_RATE are chosen in start_analysis instead, so they are
+    served exactly as they would be otherwise.
+    """
+    if not header_flag(request.headers.get("x-profile")):
+        return None
+    if not is_admin(request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="Profiling requires a valid admin token")
+    return uuid.uuid4().hex
+
+async def wait_for_disconnect(request: Request):
+    """Return once the client has closed the connection."""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def wait_for_job(request: Request, job: AnalysisJob) -> dict:
+    """
+    Wait for a job's final event, or until the client disconnects.
+    
+    Waiting counts as subscribing to the job, so a run shared by several
+    requests is only cancelled once none of them is waiting for it.
+    """
+    final = asyncio.ensure_future(job.final_event())
+    disconnect = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait({final, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        final.cancel()
+    
+    if final in done:
+        return final.result()
+    raise AnalysisCancelled(CLIENT_DISCONNECTED)
+
+def publish_validated(job: AnalysisJob):
+    job.publish({'step': 1, 'message': 'Uploading and validating document...', 'progress': 10, 'job_id': job.id})
+    job.publish({'step': 1, 'message': 'Document validated successfully', 'progress': 20})
+
+async def start_analysis(
+    cache_key: str,
+    payload: dict,
+    tenant: str,
+    policy_text: str,
+    premium: bool,
+    api_key: Optional[str],
+    llm_provider: str,
+    frameworks: Tuple[str, ...],
+    profile_id: Optional[str] = None,
+    owner: Optional[str] = None
+) -> Tuple[AnalysisJob, Optional[str]]:
+    """
+    Start an analysis job, or join the identical one already running.
+    
+    Returns the job and the id of its profile, if the run is profiled:
+    ``profile_id`` forces a profiled run of its own, and new runs are also
+    sampled at PROFILE_SAMPLE_RATE. A new run is recorded in the history of
+    ``owner`` (see history_owner).
+    
+    Concurrent requests for the same document, tier, provider and frameworks
+    share one crew run and all receive its progress events and result. New runs are
+    queued by the fair scheduler. Only starting a new run takes a token from
+    the tenant's rate limit bucket; RateLimited is raised if the bucket is
+    empty or the tenant already has too many queued.
+    """
+    if profile_id is not None:
+        # A profile has to measure a complete run of its own
+        scheduler.check(tenant)
+        await run_in_threadpool(check_rate_limit, tenant, premium)
+        job, created = jobs.create(payload), True
+    else:
+        if jobs.flight(cache_key) is None:
+            scheduler.check(tenant)
+            await run_in_threadpool(check_rate_limit, tenant, premium)
+        job, created = jobs.start_or_join(cache_key, payload)
+        if created and sampled():
+            profile_id = uuid.uuid4().hex
+    
+    if created:
+        publish_validated(job)
+        asyncio.ensure_future(run_scheduled(
+            job, tenant, tenant_weight(premium),
+            policy_text, premium, api_key, llm_provider, cache_key, payload.get("filename"),
+            profile_id, frameworks, owner or tenant
+        ))
+        loop = asyncio.get_running_loop()
+        deadline = job.cancel_token.remaining()
+        if deadline is not None:
+            loop.call_later(deadline, job.cancel, DEADLINE_EXCEEDED)
+    return job, profile_id if created else None
+
 @app.get("/")
 async def root():
     return {
@@ -41,6 +268,11 @@ async def root():
         "endpoints": {
             "analyze": "/analyze_policy/",
             "verify_payment": "/verify_payment/",
+            "jobs": "/jobs/{job_id}",
+            "results": "/results/{result_id}",
+            "control_index": "/index/controls/{framework_id}/{control_id}",
+            "history": "/history/{document}",
+            "reports": "/reports/{report_id}",
             "health": "/health/"
         }
     }
@@ -52,16 +284,19 @@ async def health_check():
         "status": "healthy",
         "service": "ADA Policy Analyzer",
         "ai_ready": True,
+        "ai_modules_loaded": ai_modules_loaded.is_set(),
         "payment_ready": True
     }
 
 @app.post("/analyze_policy/")
 async def analyze_policy(
+    request: Request,
     file: UploadFile,
     premium: bool = Form(False),
     payment_id: Optional[str] = Form(None),
     api_key: Optional[str] = Form(None),
-    llm_provider: str = Form("openai")
+    llm_provider: str = Form("openai"),
+    frameworks: Optional[str] = Form(None)
 ):
     """
     Analyze a cybersecurity policy document.
@@ -69,6 +304,12 @@ async def analyze_policy(
     - Free tier: Returns compliance score and gap list
     - Premium tier: Includes AI-generated recommendations and detailed report
     - Supports custom API keys and multiple LLM providers (OpenAI, Gemini)
+    - frameworks: comma-separated framework ids (see /compliance_standards/); defaults to the default frameworks
+    - Rate limited per tenant (verified payment id, otherwise client IP) when a new analysis
+      starts; cached results and joined runs are free. 429 responses carry Retry-After
+    - Results carry an ETag and a Content-Location (/results/{id}); revalidate with a GET of that
+      URL and If-None-Match to get a 304. A POST whose If-None-Match matches a cached result
+      gets a 412 instead of a re-analysis
     """
     
     # Validate file
@@ -89,6 +330,11 @@ async def analyze_policy(
             detail=f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
+    try:
+        framework_ids = parse_frameworks(frameworks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     # Check payment for premium features
     if premium:
         if not payment_id:
@@ -97,12 +343,16 @@ async def analyze_policy(
                 detail="Payment required for premium analysis"
             )
         
-        if not verify_payment(payment_id):
+        if not await run_in_threadpool(verify_payment, payment_id):
             raise HTTPException(
                 status_code=402, 
                 detail="Payment verification failed"
             )
     
+    # Only a verified payment identifies a tenant; anyone else is keyed by IP
+    tenant = request_tenant(request, payment_id if premium else None)
+    owner = history_owner(request)
+    
     try:
         # Read file content
         content = await file.read()
@@ -129,26 +379,67 @@ async def analyze_policy(
                 detail="File appears to be empty or too small"
             )
         
-        # Get the crew and analyze (with custom API key if provided)
-        if api_key and llm_provider:
-            crew = get_policy_crew(api_key=api_key, provider=llm_provider)
-        else:
-            crew = get_policy_crew()
-        results = crew.analyze_policy(policy_text, premium=premium)
+        # Identical documents analyzed by any worker are served from the shared cache
+        provider = effective_provider(api_key, llm_provider)
+        cache_key = result_cache_key(content, premium, provider, framework_ids)
+        etag = result_etag(cache_key)
+        location = {"Content-Location": result_url(cache_key)}
+        # Admin-requested profiles always run the analysis
+        profile_id = profile_request(request)
+        cached = None if profile_id else await run_in_threadpool(get_store().cache_get, cache_key)
+        if cached is not None:
+            if etag_matches(request, etag):
+                return precondition_failed(etag, location)
+            if premium and "report" not in cached:
+                await run_in_threadpool(link_report, cache_key, cached, file.filename)
+            return json_result_response(request, cached, etag=etag, headers=location)
+        
+        # Run the analysis (with custom API key if provided), sharing the run
+        # with any identical request already in progress
+        job, profile_id = await start_analysis(
+            cache_key,
+            {"filename": file.filename, "premium": premium, "provider": provider, "frameworks": list(framework_ids)},
+            tenant, policy_text, premium, api_key, llm_provider, framework_ids, profile_id, owner
+        )
+        headers = {"X-Job-Id": job.id}
+        if profile_id:
+            headers["X-Profile-Id"] = profile_id
+        final = await wait_for_job(request, job)
+        if final.get("cancelled"):
+            raise AnalysisCancelled(final["cancelled"])
+        if "error" in final:
+            raise HTTPException(
+                status_code=500,
+                detail={
+                    "message": f"Analysis failed: {final['error']}",
+                    "error_type": final.get("error_type", "UnknownError"),
+                    "technical_details": final["error"]
+                }
+            )
+        results = final["result"]
         
         # Return results with detailed error info if failed
         if not results.get("success", True):
-            return {
+            return json_result_response(request, {
                 **results,
                 "error_message": results.get("message", "Unknown error"),
                 "error_type": results.get("error_type", "UnknownError"),
                 "technical_details": results.get("error", "No details available")
-            }
+            }, headers=headers)
         
-        return results
+        return json_result_response(request, results, etag=etag, headers={**headers, **location})
         
-    except HTTPException:
+    except (HTTPException, RateLimited):
         raise
+    except AnalysisCancelled as e:
+        if e.reason == DEADLINE_EXCEEDED:
+            raise HTTPException(
+                status_code=504,
+                detail=f"Analysis exceeded the {ANALYSIS_DEADLINE_SECONDS:g}s deadline"
+            )
+        # The client is gone; nobody will read this response
+        print(f"Analysis cancelled: {e.reason}")
+        return Response(status_code=499)
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
@@ -168,7 +459,7 @@ async def verify_payment_endpoint(payment: PaymentVerification):
     """
     Verify a Masumi network payment.
     """
-    is_valid = verify_payment(payment.payment_id)
+    is_valid = await run_in_threadpool(verify_payment, payment.payment_id)
     
     return {
         "payment_id": payment.payment_id,
@@ -176,153 +467,419 @@ async def verify_payment_endpoint(payment: PaymentVerification):
         "status": "confirmed" if is_valid else "pending"
     }
 
+@app.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str):
+    """
+    Get the state of an analysis job from any worker.
+    
+    The ETag changes whenever the job is updated, so pollers can send
+    If-None-Match and receive 304 until the result is in.
+    """
+    store = get_store()
+    job = await run_in_threadpool(store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if jobs.get(job_id) is None and await run_in_threadpool(fail_lost_job, job):
+        job = await run_in_threadpool(store.get_job, job_id)
+    etag = f'W/"{job_id}-{job["updated"]!r}"'
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return json_result_response(request, job, etag=etag)
+
+@app.get("/results/{result_id}")
+async def get_result(request: Request, result_id: str):
+    """
+    Get a cached analysis result by the id in its Content-Location.
+    
+    Send the result's ETag in If-None-Match to receive 304 while it is
+    unchanged; 404 once it has expired from the cache.
+    """
+    result = await run_in_threadpool(cached_result, result_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    etag = f'W/"{result_id}"'
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return json_result_response(request, result, etag=etag)
+
+@app.get("/index/controls/{framework_id}/{control_id}")
+async def query_control_index(
+    request: Request,
+    framework_id: str,
+    control_id: str,
+    status: str = "missing",
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    tenant: Optional[str] = None
+):
+    """
+    List the caller's analyzed documents where a framework's control is missing (or present).
+    
+    Control ids are only unique within a framework, e.g. /index/controls/NIST/AC-1.
+    Documents are those analyzed with the caller's X-Account-Key, otherwise
+    from the client IP; with X-Admin-Token, ``tenant`` selects another
+    owner, e.g. "bulk" for bulk runs. A named document is listed once, as
+    its latest revision. Each document carries its score in the framework,
+    from the latest analysis that evaluated it. Documents are ordered by
+    name (or document_id if unnamed). Pass the returned next_cursor to get
+    the following page.
+    """
+    if tenant is None:
+        tenant = history_owner(request)
+    elif not is_admin(request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="Admin token required to query another tenant")
+    try:
+        framework = load_catalog().select([framework_id])[0]
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Unknown framework: {framework_id}")
+    if control_id not in framework.by_id:
+        raise HTTPException(status_code=404, detail=f"Unknown control: {framework.id} {control_id}")
+    status = status.lower()
+    if status not in INDEX_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Allowed: {', '.join(INDEX_STATUSES)}")
+    
+    store = get_store()
+    # Fetch one extra row to know whether another page exists
+    documents = await run_in_threadpool(
+        store.query_control_index, tenant, framework.id, control_id, status, cursor or "", limit + 1
+    )
+    next_cursor = documents[limit - 1]["document"] if len(documents) > limit else None
+    return {
+        "framework": framework.id,
+        "control_id": control_id,
+        "status": status,
+        "total": await run_in_threadpool(store.count_control_index, tenant, framework.id, control_id, status),
+        "documents": documents[:limit],
+        "next_cursor": next_cursor
+    }
+
+@app.get("/history/{document:path}")
+async def get_history(
+    request: Request,
+    document: str,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    granularity: str = "day",
+    limit: int = Query(1000, ge=1, le=10000)
+):
+    """
+    Compliance score history of a document for trend charts.
+    
+    The document is the uploaded file name (which may contain "/"), or the
+    document_id of an analysis uploaded without a name. Names are looked up
+    in the caller's own history: that of the X-Account-Key sent with the
+    analyses, otherwise of the client IP. With X-Admin-Token, the document is the full
+    history key, e.g. "bulk/dir/policy.txt" for bulk runs. Daily and weekly
+    points come from rollups kept up to date on every analysis;
+    granularity=raw lists the individual analyses.
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Invalid granularity. Allowed: {', '.join(GRANULARITIES)}")
+    
+    if is_admin(request.headers.get("x-admin-token")) or DOCUMENT_ID_PATTERN.fullmatch(document):
+        key = document
+    else:
+        key = history_key(history_owner(request), document, document)
+    
+    start_ts = to_timestamp(start) if start else 0.0
+    end_ts = to_timestamp(end) if end else time.time() + 1
+    return {
+        "document": document,
+        "granularity": granularity,
+        "points": await run_in_threadpool(query_history, key, start_ts, end_ts, granularity, limit)
+    }
+
+@app.get("/admin/profiles/{request_id}")
+async def get_profile(
+    request_id: str,
+    format: str = "json",
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Get a stored analysis profile (admin only).
+    
+    format=json returns the summary with the slowest functions and peak
+    traced memory, format=text the pstats report, and format=pstats the
+    raw profile for tools such as snakeviz.
+    """
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    profile = await run_in_threadpool(get_store().get_profile, request_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    summary, stats = profile
+    if format == "pstats":
+        return Response(
+            stats,
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{request_id}.prof"'}
+        )
+    if format == "text":
+        return PlainTextResponse(summary["report"])
+    return summary
+
+@app.get("/reports/{report_id}")
+async def get_report_status(report_id: str):
+    """
+    Get the rendering status of a premium report and its download links.
+    """
+    report = await run_in_threadpool(get_report, report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    status = {"id": report_id, "status": report["status"]}
+    if report["status"] == "done":
+        status["formats"] = {
+            fmt: f"{report_url(report_id)}/{fmt}" for fmt in report["result"]["artifacts"]
+        }
+    elif report["status"] == "failed":
+        status["error"] = report["result"].get("error")
+    return status
+
+@app.get("/reports/{report_id}/{fmt}")
+async def download_report(request: Request, report_id: str, fmt: str):
+    """
+    Download a rendered premium report (html or pdf).
+    
+    Artifacts are immutable and addressed by content, so they are served
+    with a strong ETag, long-lived caching and Range support. While the
+    report is still rendering the response is 202 with Retry-After.
+    """
+    report = await run_in_threadpool(get_report, report_id)
+    if report is None or fmt not in REPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="Report not found")
+    if report["status"] in ("queued", "running"):
+        return JSONResponse(
+            status_code=202,
+            content={"id": report_id, "status": report["status"]},
+            headers={"Retry-After": str(max(1, math.ceil(REPORT_POLL_SECONDS)))}
+        )
+    if report["status"] != "done":
+        raise HTTPException(status_code=500, detail=f"Report rendering failed: {report['result'].get('error')}")
+    
+    artifact = report["result"]["artifacts"].get(fmt)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail=f"Report not available as {fmt}")
+    
+    etag = f'"{artifact["sha256"]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    path = artifact_path(artifact["sha256"], fmt)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=410, detail="Report artifact is no longer stored")
+    return FileResponse(
+        path,
+        media_type=REPORT_MEDIA_TYPES[fmt],
+        headers=headers,
+        filename=f"compliance_report_{report_id}.{fmt}",
+        content_disposition_type="inline" if fmt == "html" else "attachment"
+    )
+
 @app.get("/compliance_standards/")
 async def get_compliance_standards():
     """
-    Get list of supported compliance standards.
+    Get list of supported compliance standards, from the loaded control catalog.
+    
+    The id of a standard selects it in the frameworks field of an analysis;
+    default standards are evaluated when no frameworks are given.
     """
     return {
         "standards": [
             {
-                "name": "NIST 800-53",
-                "version": "Rev 5",
-                "controls": 8
-            },
-            {
-                "name": "ISO 27001",
-                "version": "2022",
-                "controls": 6
-            },
-            {
-                "name": "DPDP Act",
-                "version": "2023",
-                "requirements": 3
+                "id": framework.id,
+                "name": framework.name,
+                "version": framework.version,
+                "controls": len(framework.controls),
+                "default": framework.default
             }
+            for framework in load_catalog().frameworks.values()
         ]
     }
 
 @app.post("/analyze_policy_stream/")
 async def analyze_policy_stream(
+    request: Request,
     file: UploadFile,
     premium: bool = Form(False),
     payment_id: Optional[str] = Form(None),
     api_key: Optional[str] = Form(None),
-    llm_provider: str = Form("openai")
+    llm_provider: str = Form("openai"),
+    frameworks: Optional[str] = Form(None)
 ):
-    """Stream analysis progress with real-time updates"""
+    """
+    Stream analysis progress with real-time updates.
     
-    async def event_generator():
-        message_queue = queue.Queue()
+    Every event carries an id. If the connection drops, reconnect to
+    /analyze_policy_stream/{job_id} with a Last-Event-ID header to receive
+    the remaining events without re-running the analysis. A run with no
+    connected client for STREAM_RESUME_GRACE_SECONDS, or one that exceeds
+    ANALYSIS_DEADLINE_SECONDS, is cancelled.
+    
+    Rate limits are enforced before streaming starts, as 429 responses,
+    and only when the request starts a new analysis.
+    """
+    
+    provider = effective_provider(api_key, llm_provider)
+    payload = {"filename": file.filename, "premium": premium, "provider": provider}
+    
+    try:
+        framework_ids = parse_frameworks(frameworks)
+        payload["frameworks"] = list(framework_ids)
+        content = await file.read()
         
-        try:
-            # Step 1: Validate and read file
-            yield f"data: {json.dumps({'step': 1, 'message': 'Uploading and validating document...', 'progress': 10})}\n\n"
-            await asyncio.sleep(0.5)
-            
-            content = await file.read()
-            if not content:
-                yield f"data: {json.dumps({'error': 'Empty file'})}\n\n"
-                return
-            
-            # Get file extension
-            filename = file.filename or "policy.txt"
-            file_ext = os.path.splitext(filename)[1].lower()
-            if not file_ext:
-                file_ext = ".txt"
-                
-            if file_ext not in ALLOWED_EXTENSIONS:
-                yield f"data: {json.dumps({'error': f'Invalid file type. Allowed: {ALLOWED_EXTENSIONS}'})}\n\n"
-                return
-            
-            policy_text = content.decode('utf-8', errors='ignore')
-            yield f"data: {json.dumps({'step': 1, 'message': 'Document validated successfully', 'progress': 20})}\n\n"
+        # Get file extension
+        filename = file.filename or "policy.txt"
+        file_ext = os.path.splitext(filename)[1].lower()
+        if not file_ext:
+            file_ext = ".txt"
+        
+        # Validate file and check payment for premium
+        if not content:
+            error = 'Empty file'
+        elif file_ext not in ALLOWED_EXTENSIONS:
+            error = f'Invalid file type. Allowed: {ALLOWED_EXTENSIONS}'
+        elif premium and not payment_id:
+            error = 'Payment required for premium analysis'
+        elif premium and not await run_in_threadpool(verify_payment, payment_id):
+            error = 'Payment verification failed'
+        else:
+            error = None
+    except Exception as e:
+        error = str(e)
+    
+    tenant = request_tenant(request, payment_id if premium and error is None else None)
+    owner = history_owner(request)
+    profile_id = None
+    if error is not None:
+        job = jobs.create(payload)
+        job.publish({'step': 1, 'message': 'Uploading and validating document...', 'progress': 10, 'job_id': job.id})
+        job.fail(error)
+    else:
+        policy_text = content.decode('utf-8', errors='ignore')
+        cache_key = result_cache_key(content, premium, provider, framework_ids)
+        profile_id = profile_request(request)
+        cached = None if profile_id else await run_in_threadpool(get_store().cache_get, cache_key)
+        if cached is not None:
+            if premium and "report" not in cached:
+                await run_in_threadpool(link_report, cache_key, cached, file.filename)
+            job = jobs.create(payload)
+            publish_validated(job)
+            job.complete(cached)
+        else:
+            # Identical streams in progress share one run; a joining client
+            # receives every event from the start
+            job, profile_id = await start_analysis(
+                cache_key, payload, tenant, policy_text, premium, api_key, llm_provider,
+                framework_ids, profile_id, owner
+            )
+    
+    headers = {**SSE_HEADERS, "X-Job-Id": job.id}
+    if profile_id:
+        headers["X-Profile-Id"] = profile_id
+
+    return StreamingResponse(
+        stream_job(job),
+        media_type="text/event-stream",
+        headers=headers
+    )
+
+@app.get("/analyze_policy_stream/{job_id}")
+async def resume_analysis_stream(job_id: str, last_event_id: Optional[str] = Header(None)):
+    """
+    Resume an analysis stream after the events already received.
+    """
+    try:
+        after = int(last_event_id) if last_event_id else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    
+    job = jobs.get(job_id)
+    if job is not None:
+        events = stream_job(job, after)
+    elif await run_in_threadpool(get_store().get_job, job_id) is not None:
+        # Started on another worker; replay it from the shared store
+        events = stream_stored_job(job_id, after)
+    else:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "X-Job-Id": job_id}
+    )
+
+def link_report(cache_key: str, result: dict, document_name: Optional[str] = None):
+    """
+    Queue the premium report of a result and add its reference to it.
+    
+    Reports are rendered in the background and the response only links to
+    them. Queuing is best effort: if it fails, the result is returned
+    without a report and the next cache hit for it tries again.
+    """
+    try:
+        result["report"] = enqueue_report(cache_key, result, document_name)
+    except Exception as e:
+        print(f"WARNING: Could not queue report for {cache_key}: {e}")
+
+async def run_scheduled(job: AnalysisJob, tenant: str, weight: float, *args):
+    """Run an analysis job once the fair scheduler grants it a slot."""
+    if scheduler.busy:
+        job.publish({'step': 1, 'message': 'Waiting for an available analysis slot...', 'progress': 20})
+    await scheduler.acquire(tenant, weight)
+    
+    started = None
+    try:
+        # Skip runs cancelled while queued (deadline or every client gone)
+        if not job.finished:
+            started = time.monotonic()
+            # Run the crew in a worker thread; progress events are published
+            # by the crew's task callbacks as agents start.
+            await asyncio.get_running_loop().run_in_executor(None, run_analysis, job, *args)
+    finally:
+        scheduler.release(time.monotonic() - started if started is not None else None)
+
+def run_analysis(
+    job: AnalysisJob,
+    policy_text: str,
+    premium: bool,
+    api_key: Optional[str],
+    llm_provider: str,
+    cache_key: str,
+    document_name: Optional[str] = None,
+    profile_id: Optional[str] = None,
+    frameworks: Optional[Tuple[str, ...]] = None,
+    tenant: Optional[str] = None
+):
+    """Run an analysis to completion, publishing progress to its job."""
+    # The profile is stored before the result is published
+    profiler = RequestProfiler(profile_id) if profile_id else contextlib.nullcontext()
+    try:
+        with profiler:
+            # Get crew with selected LLM
+            if api_key and llm_provider:
+                crew = get_policy_crew(api_key=api_key, provider=llm_provider)
+            else:
+                crew = get_policy_crew()
             
-            # Check payment for premium
+            result = crew.analyze_policy(
+                policy_text,
+                premium=premium,
+                progress_callback=job.publish,
+                cancel_token=job.cancel_token,
+                document_name=document_name,
+                frameworks=frameworks,
+                tenant=tenant
+            )
+        
+        if result.get("success", True):
             if premium:
-                if not payment_id:
-                    yield f"data: {json.dumps({'error': 'Payment required for premium analysis'})}\n\n"
-                    return
-                if not verify_payment(payment_id):
-                    yield f"data: {json.dumps({'error': 'Payment verification failed'})}\n\n"
-                    return
-            
-            # Step 2: Start analysis with output capture
-            def run_crew_analysis():
-                old_stdout = sys.stdout
-                sys.stdout = output_buffer = io.StringIO()
-                
-                try:
-                    # Get crew with selected LLM
-                    if api_key and llm_provider:
-                        crew = get_policy_crew(api_key=api_key, provider=llm_provider)
-                    else:
-                        crew = get_policy_crew()
-                    
-                    last_position = 0
-                    result = None
-                    
-                    def execute_crew():
-                        nonlocal result
-                        result = crew.analyze_policy(policy_text, premium=premium)
-                    
-                    crew_thread = threading.Thread(target=execute_crew)
-                    crew_thread.start()
-                    
-                    # Monitor output while crew is running
-                    while crew_thread.is_alive():
-                        current_output = output_buffer.getvalue()
-                        if len(current_output) > last_position:
-                            new_text = current_output[last_position:]
-                            last_position = len(current_output)
-                            
-                            # Parse output for agent activity
-                            if "Cybersecurity Policy Reader" in new_text:
-                                message_queue.put({
-                                    'step': 2, 
-                                    'message': 'Policy Reader Agent extracting security sections...', 
-                                    'progress': 35
-                                })
-                            elif "Compliance Standards Auditor" in new_text:
-                                message_queue.put({
-                                    'step': 3, 
-                                    'message': 'Compliance Auditor evaluating standards...', 
-                                    'progress': 55
-                                })
-                            elif "Security Improvement Consultant" in new_text and premium:
-                                message_queue.put({
-                                    'step': 4, 
-                                    'message': 'AI Consultant generating recommendations...', 
-                                    'progress': 75
-                                })
-                        
-                        time.sleep(0.5)
-                    
-                    crew_thread.join()
-                    
-                    # Send final result
-                    message_queue.put({
-                        'complete': True,
-                        'result': result,
-                        'progress': 100
-                    })
-                    
-                finally:
-                    sys.stdout = old_stdout
-            
-            # Run analysis in background thread
-            analysis_thread = threading.Thread(target=run_crew_analysis)
-            analysis_thread.start()
-            
-            # Stream messages from queue
-            while analysis_thread.is_alive() or not message_queue.empty():
-                try:
-                    message = message_queue.get(timeout=0.5)
-                    yield f"data: {json.dumps(message)}\n\n"
-                    await asyncio.sleep(0.1)
-                except queue.Empty:
-                    await asyncio.sleep(0.5)
-            
-        except Exception as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
-    
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+                link_report(cache_key, result, document_name)
+            cache_result(cache_key, result)
+        job.complete(result)
+    except AnalysisCancelled as e:
+        job.cancel(e.reason)
+    except Exception as e:
+        job.fail(str(e), error_type=type(e).__name__)
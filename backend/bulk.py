@@ -0,0 +1,338 @@
+"""
+Offline bulk analyzer: score every policy file under a directory.
+
+    python -m backend.bulk policies/ --output results.jsonl --workers 8
+    python -m backend.bulk policies/ --output results/ --format parquet --resume
+    python -m backend.bulk policies/ --output results.jsonl --resume --llm --llm-rate 20
+    python -m backend.bulk policies/ --output pci.jsonl --frameworks PCI SOC2
+
+Files are scored with extract_sections + check_compliance in a process
+pool. The control catalog is loaded once before the pool forks, so every
+worker shares it. Results are written as they arrive; with --resume, files
+already present in the output are skipped. --llm additionally runs the
+agent crew on every scored file not yet in the crew output, at most
+--llm-rate per minute, and writes its output next to the scores.
+"""
+import argparse
+import gc
+import mmap
+import multiprocessing
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+from backend import json_codec
+from backend.agents.catalog import load_catalog
+from backend.agents.results import Status
+from backend.agents.tools import extract_sections, check_compliance
+from backend.compliance_index import document_fingerprint, index_compliance
+from backend.config import ALLOWED_EXTENSIONS
+from backend.history import history_key, record_history
+
+# Parquet output is optional
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+
+PROGRESS_EVERY = 500
+# Tenant of the compliance history recorded by bulk runs
+BULK_TENANT = "bulk"
+PARQUET_BATCH_ROWS = 5000
+
+# Set in each pool worker by init_worker
+_record_results = False
+_frameworks: Tuple[str, ...] = ()
+
+
+def walk_policies(root: str, extensions: Set[str]) -> Iterator[str]:
+    """Paths relative to root of all policy files, in a stable order."""
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in extensions:
+                yield os.path.relpath(os.path.join(directory, name), root)
+
+
+def read_policy(path: str) -> str:
+    """Decode a policy file through a memory map, without an intermediate bytes copy."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return str(memoryview(mapped), "utf-8", "ignore")
+
+
+def init_worker(record_results: bool, frameworks: Tuple[str, ...]):
+    global _record_results, _frameworks
+    _record_results = record_results
+    _frameworks = frameworks
+
+
+def analyze_file(task) -> Dict[str, Any]:
+    """Score one file; errors are reported in the record instead of raised."""
+    root, relative_path = task
+    record: Dict[str, Any] = {"path": relative_path}
+    try:
+        policy_text = read_policy(os.path.join(root, relative_path))
+        if len(policy_text) < 10:
+            record["error"] = "File appears to be empty or too small"
+            return record
+
+        sections = extract_sections(policy_text)
+        result = check_compliance(policy_text, sections, _frameworks)
+        document_id = document_fingerprint(policy_text)
+        if _record_results:
+            index_compliance(BULK_TENANT, document_id, result, relative_path)
+            record_history(history_key(BULK_TENANT, relative_path, document_id), document_id, result)
+
+        record.update({
+            "document_id": document_id,
+            "size": len(policy_text),
+            "score": result.score,
+            "counts": result.counts(),
+            "gaps": result.labels(Status.MISSING),
+            "strengths": result.labels(Status.PRESENT),
+            "sections_found": [name for name, content in sections.items() if content],
+        })
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+class JSONLWriter:
+    """Append records to a JSONL file; resumable from the paths already written."""
+
+    def __init__(self, path: str, resume: bool):
+        self.path = path
+        # Paths already written, and those among them without an error
+        self.done: Set[str] = set()
+        self.scored: Set[str] = set()
+        if resume and os.path.exists(path):
+            self._recover()
+        self._file = open(path, "ab" if resume else "wb")
+
+    def _recover(self):
+        valid_size = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                # A run killed mid-write leaves a partial last line
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json_codec.loads(line)
+                    self.done.add(record["path"])
+                except (ValueError, KeyError):
+                    break
+                if "error" not in record:
+                    self.scored.add(record["path"])
+                valid_size += len(line)
+        with open(self.path, "r+b") as f:
+            f.truncate(valid_size)
+
+    def write(self, record: Dict[str, Any]):
+        self.done.add(record["path"])
+        if "error" not in record:
+            self.scored.add(record["path"])
+        self._file.write(json_codec.dumps_bytes(record) + b"\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """
+    Write records to a directory of Parquet part files.
+
+    Parquet files cannot be appended to, so every batch becomes a new part;
+    resuming reads the paths of the existing parts.
+    """
+
+    SCHEMA = None if pyarrow is None else pyarrow.schema([
+        ("path", pyarrow.string()),
+        ("document_id", pyarrow.string()),
+        ("size", pyarrow.int64()),
+        ("score", pyarrow.int32()),
+        ("counts", pyarrow.string()),
+        ("gaps", pyarrow.list_(pyarrow.string())),
+        ("strengths", pyarrow.list_(pyarrow.string())),
+        ("sections_found", pyarrow.list_(pyarrow.string())),
+        ("error", pyarrow.string()),
+    ])
+
+    def __init__(self, directory: str, resume: bool, batch_rows: int = PARQUET_BATCH_ROWS):
+        if pyarrow is None:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)")
+        self.directory = directory
+        self.batch_rows = batch_rows
+        self.done: Set[str] = set()
+        self.scored: Set[str] = set()
+        self._rows: List[Dict[str, Any]] = []
+
+        os.makedirs(directory, exist_ok=True)
+        parts = sorted(name for name in os.listdir(directory) if name.endswith(".parquet"))
+        if resume:
+            for name in parts:
+                table = parquet.read_table(os.path.join(directory, name), columns=["path", "error"])
+                for path, error in zip(table.column("path").to_pylist(), table.column("error").to_pylist()):
+                    self.done.add(path)
+                    if error is None:
+                        self.scored.add(path)
+        else:
+            for name in parts:
+                os.remove(os.path.join(directory, name))
+            parts = []
+        self._next_part = len(parts)
+
+    def write(self, record: Dict[str, Any]):
+        self.done.add(record["path"])
+        if "error" not in record:
+            self.scored.add(record["path"])
+        row = dict(record)
+        if "counts" in row:
+            row["counts"] = json_codec.dumps(row["counts"])
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_rows:
+            self._write_part()
+
+    def flush(self):
+        """Parts are only written once a batch is full, to keep them large."""
+
+    def _write_part(self):
+        if not self._rows:
+            return
+        table = pyarrow.Table.from_pylist(self._rows, schema=self.SCHEMA)
+        path = os.path.join(self.directory, f"part-{self._next_part:05d}.parquet")
+        # Write under a temporary name so a crash never leaves a truncated part
+        parquet.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self._next_part += 1
+        self._rows = []
+
+    def close(self):
+        self._write_part()
+
+
+def score_files(args, writer):
+    """Score all files not yet in the output."""
+    extensions = {ext if ext.startswith(".") else "." + ext for ext in args.extensions}
+    pending = [path for path in walk_policies(args.root, extensions) if path not in writer.done]
+    print(f"{len(writer.done)} files already done, {len(pending)} to analyze")
+    if not pending:
+        return
+
+    # Load the catalog before forking so all workers share it, and keep
+    # the collector from touching (and copying) the inherited objects.
+    load_catalog()
+    gc.freeze()
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    scored = 0
+    started = time.monotonic()
+    with context.Pool(args.workers, initializer=init_worker,
+                      initargs=(args.index, args.frameworks)) as pool:
+        tasks = ((args.root, path) for path in pending)
+        for count, record in enumerate(pool.imap_unordered(analyze_file, tasks, chunksize=args.chunksize), 1):
+            writer.write(record)
+            scored += "error" not in record
+            if count % PROGRESS_EVERY == 0:
+                writer.flush()
+                rate = count / (time.monotonic() - started)
+                print(f"Analyzed {count}/{len(pending)} files ({rate:.0f} files/s)")
+
+    writer.flush()
+    elapsed = time.monotonic() - started
+    print(f"Analyzed {len(pending)} files in {elapsed:.1f}s ({scored} scored)")
+
+
+def run_llm_phase(args, paths: Set[str]):
+    """
+    Run the agent crew on scored files, at most --llm-rate per minute.
+
+    ``paths`` are all scored files in the output, whether scored in this
+    run or an earlier one; files with a crew result in --llm-output are
+    skipped.
+    """
+    from backend.crew_orchestrator import get_policy_crew
+
+    crew = get_policy_crew(api_key=args.api_key, provider=args.provider)
+    writer = JSONLWriter(args.llm_output, resume=True)
+    # Failed crew runs are written with their error and retried on resume
+    pending = sorted(path for path in paths if path not in writer.scored)
+    interval = 60.0 / args.llm_rate if args.llm_rate > 0 else 0.0
+    print(f"Running the crew on {len(pending)} files")
+
+    next_start = time.monotonic()
+    try:
+        for count, path in enumerate(pending, 1):
+            delay = next_start - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_start = time.monotonic() + interval
+
+            policy_text = read_policy(os.path.join(args.root, path))
+            result = crew.analyze_policy(policy_text, premium=args.premium, document_name=path,
+                                         frameworks=args.frameworks, tenant=BULK_TENANT,
+                                         record_results=args.index)
+            writer.write({"path": path, **result})
+            writer.flush()
+            print(f"Crew analysis {count}/{len(pending)}: {path} ({result.get('score')}%)")
+    finally:
+        writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score all policy files under a directory")
+    parser.add_argument("root", help="Directory to scan for policy files")
+    parser.add_argument("--output", required=True,
+                        help="JSONL file, or directory of part files with --format parquet")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--resume", action="store_true", help="Skip files already in the output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunksize", type=int, default=16, help="Files handed to a worker at a time")
+    parser.add_argument("--extensions", nargs="+", default=sorted(ALLOWED_EXTENSIONS))
+    parser.add_argument("--frameworks", nargs="+", default=[],
+                        help="Framework ids to evaluate (default: the catalog's default frameworks)")
+    parser.add_argument("--index", action="store_true",
+                        help="Also record results in the control index and history of the state store")
+    parser.add_argument("--llm", action="store_true",
+                        help="Run the agent crew on every scored file in the output, including files "
+                             "recovered with --resume; files already in --llm-output are skipped")
+    parser.add_argument("--llm-rate", type=float, default=10.0, help="Crew analyses per minute (0: no limit)")
+    parser.add_argument("--llm-output", help="JSONL file for crew results (default: <output>.llm.jsonl)")
+    parser.add_argument("--premium", action="store_true", help="Premium-grade crew output with recommendations")
+    parser.add_argument("--provider", default="openai", choices=["openai", "gemini"])
+    parser.add_argument("--api-key", default=None, help="LLM API key (default: from .env)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        parser.error(f"Not a directory: {args.root}")
+    try:
+        args.frameworks = tuple(framework.id for framework in load_catalog().select(args.frameworks))
+    except ValueError as e:
+        parser.error(str(e))
+    if args.llm and not args.llm_output:
+        args.llm_output = args.output.rstrip(os.sep) + ".llm.jsonl"
+
+    if args.format == "parquet":
+        writer = ParquetWriter(args.output, args.resume)
+    else:
+        writer = JSONLWriter(args.output, args.resume)
+    try:
+        score_files(args, writer)
+    finally:
+        writer.close()
+
+    if args.llm:
+        run_llm_phase(args, writer.scored)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import threading
+import time
+from typing import Optional
+
+# Cancellation reasons
+CLIENT_DISCONNECTED = "client disconnected"
+DEADLINE_EXCEEDED = "deadline exceeded"
+
+
+class AnalysisCancelled(Exception):
+    """Raised inside an analysis when its cancel token fires."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    Cooperative cancellation for one analysis run.
+
+    The token is cancelled explicitly (e.g. the client disconnected) or
+    implicitly once its deadline passes. Long-running code calls check()
+    at safe points, such as before every LLM call, and unwinds with
+    AnalysisCancelled.
+    """
+
+    def __init__(self, deadline_seconds: Optional[float] = None):
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+        self._event = threading.Event()
+        self._reason = "cancelled"
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._event.is_set():
+            self._reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(DEADLINE_EXCEEDED)
+            return True
+        return False
+
+    @property
+    def reason(self) -> str:
+        return self._reason
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the deadline, or None if there is no deadline."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        if self.cancelled:
+            raise AnalysisCancelled(self._reason)
@@ -0,0 +1,35 @@
+import hashlib
+from typing import Iterator, Optional, Tuple
+
+from backend.agents.results import ComplianceResult
+from backend.state_store import get_store
+
+INDEX_STATUSES = ("present", "missing")
+
+
+def document_fingerprint(policy_text: str) -> str:
+    """Stable id of a policy document, derived from its text."""
+    return hashlib.sha256(policy_text.encode("utf-8")).hexdigest()
+
+
+def postings(result: ComplianceResult) -> Iterator[Tuple[str, str, str, Optional[str], Optional[int]]]:
+    """(framework, control_id, status, keyword, offset) for every control of the result's frameworks."""
+    for control in result.controls():
+        keyword, offset = result.hit(control) or (None, None)
+        yield control.framework.id, control.id, result.status(control).label.lower(), keyword, offset
+
+
+def index_compliance(tenant: Optional[str], fingerprint: str, result: ComplianceResult,
+                     name: Optional[str] = None):
+    """
+    Record a document's compliance result in the tenant's control index.
+
+    Named documents are indexed by name, so a revised policy replaces its
+    earlier revision; others by fingerprint. Indexing is best effort: a
+    failure is logged and never fails the analysis that produced the result.
+    """
+    scores = {framework.id: result.framework_score(framework) for framework in result.frameworks}
+    try:
+        get_store().index_document(tenant or "", name or fingerprint, fingerprint, scores, postings(result))
+    except Exception as e:
+        print(f"WARNING: Could not index document {fingerprint[:12]}: {e}")
@@ -20,8 +20,55 @@ MASUMI_API_KEY = os.getenv("MASUMI_API_KEY", "")
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_EXTENSIONS = {".txt", ".pdf", ".doc", ".docx"}
 
-# Compliance Standards
-COMPLIANCE_STANDARDS = ["NIST 800-53", "ISO 27001", "DPDP Act 2023"]
+# Shared State (result cache, payment ledger and jobs across workers)
+STATE_DB_PATH = os.getenv(
+    "STATE_DB_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "state.db")
+)
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "86400"))  # 24 hours
+
+# Streaming (SSE) Configuration
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "600"))  # Resume window after a job finishes
+
+# Analysis Limits
+ANALYSIS_DEADLINE_SECONDS = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", "300"))  # 0 disables the deadline
+STREAM_RESUME_GRACE_SECONDS = float(os.getenv("STREAM_RESUME_GRACE_SECONDS", "5"))  # Wait for a reconnect before cancelling
+
+# Fair Scheduling (per worker) and Rate Limits (per tenant, shared by all workers)
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "4"))  # Crew runs at once per worker
+MAX_QUEUED_PER_TENANT = int(os.getenv("MAX_QUEUED_PER_TENANT", "10"))
+PREMIUM_WEIGHT = float(os.getenv("PREMIUM_WEIGHT", "4"))  # Share of queued slots relative to free runs
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "10"))  # 0 disables the limit
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "5"))
+PREMIUM_RATE_LIMIT_PER_MINUTE = float(os.getenv("PREMIUM_RATE_LIMIT_PER_MINUTE", "60"))
+PREMIUM_RATE_LIMIT_BURST = int(os.getenv("PREMIUM_RATE_LIMIT_BURST", "20"))
+
+# Premium Reports (rendered in the background, stored content-addressed)
+REPORTS_DIR = os.getenv(
+    "REPORTS_DIR",
+    os.path.join(os.path.dirname(__file__), "data", "reports")
+)
+RENDER_REPORTS = os.getenv("RENDER_REPORTS", "true").lower() == "true"  # Run a renderer thread in each API worker
+REPORT_POLL_SECONDS = float(os.getenv("REPORT_POLL_SECONDS", "2"))
+
+# Profiling (admin only; both triggers are off by default)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # Required in X-Admin-Token to request or read profiles
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # Fraction of analyses profiled automatically
+PROFILE_RETENTION_SECONDS = int(os.getenv("PROFILE_RETENTION_SECONDS", "604800"))  # 7 days
+
+# Production Server
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "4"))
+BIND_ADDRESS = os.getenv("BIND_ADDRESS", "0.0.0.0:8000")
+
+# Import CrewAI/LLM modules in the background at startup instead of on the first analysis
+WARMUP_AI_MODULES = os.getenv("WARMUP_AI_MODULES", "false").lower() == "true"
+
+# Compliance Frameworks (one JSON catalog file per framework)
+CATALOG_DIR = os.getenv(
+    "CATALOG_DIR",
+    os.path.join(os.path.dirname(__file__), "data", "catalog")
+)
 
 # Pricing
 PREMIUM_REPORT_PRICE_ADA = 5.0  # 5 ADA tokens for full report
@@ -1,6 +1,6 @@
 from crewai import Agent, Task, Crew, Process
 from langchain_openai import ChatOpenAI
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, Iterable, List
 import json
 from backend.config import OPENAI_API_KEY, OPENAI_MODEL, GEMINI_API_KEY, GEMINI_MODEL
 from backend.agents.tools import (
@@ -9,14 +9,49 @@ from backend.agents.tools import (
     generate_recommendations,
     create_compliance_summary
 )
+from backend.agents.catalog import Framework, load_catalog
+from backend.agents.results import Status
+from backend.compliance_index import document_fingerprint, index_compliance
+from backend.history import history_key, record_history
+from backend.cancellation import AnalysisCancelled, CancelToken
 
-# Try to import Gemini, but don't fail if not available
-try:
-    from langchain_google_genai import ChatGoogleGenerativeAI
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-    print("Warning: Google Gemini not available. Install langchain-google-genai to use Gemini.")
+def guard_llm_calls(llm, crew: "PolicyAnalysisCrew"):
+    """
+    Make every call on an agent's LLM check the crew's current cancel token.
+    
+    CrewAI has no hook that runs before an LLM request, so the call method
+    of the agent's LLM instance is wrapped.
+    """
+    unguarded_call = type(llm).call
+    
+    def guarded_call(*args, **kwargs):
+        if crew.cancel_token is not None:
+            crew.cancel_token.check()
+        return unguarded_call(llm, *args, **kwargs)
+    
+    llm.call = guarded_call
+
+def load_gemini_chat_model():
+    """
+    Import the Gemini chat model class on first use.
+    
+    Returns None if langchain-google-genai is not installed.
+    """
+    try:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+    except ImportError:
+        print("Warning: Google Gemini not available. Install langchain-google-genai to use Gemini.")
+        return None
+    return ChatGoogleGenerativeAI
+
+def framework_checklist(frameworks: Iterable[Framework]) -> str:
+    """Numbered list of frameworks and their control ids for the compliance task."""
+    lines: List[str] = []
+    for number, framework in enumerate(frameworks, 1):
+        kind = "requirements" if framework.id_field == "requirement_id" else "controls"
+        control_ids = ", ".join(control.id for control in framework.controls)
+        lines.append(f"{number}. {framework.name} {kind} ({control_ids})")
+    return "\n            ".join(lines)
 
 class PolicyAnalysisCrew:
     def __init__(self, llm=None):
@@ -30,6 +65,7 @@ class PolicyAnalysisCrew:
             )
         else:
             self.llm = llm
+        self.cancel_token: Optional[CancelToken] = None
         self.setup_agents()
         
     def setup_agents(self):
@@ -48,18 +84,9 @@ class PolicyAnalysisCrew:
             llm=self.llm
         )
         
-        # Compliance Agent - Maps policies to standards
-        self.compliance_agent = Agent(
-            role="Compliance Standards Auditor",
-            goal="Evaluate policies against NIST 800-53, ISO 27001, and DPDP Act 2023",
-            backstory="""You are a certified compliance auditor specializing in cybersecurity 
-            frameworks. You have deep knowledge of NIST 800-53 controls, ISO 27001 requirements, 
-            and India's DPDP Act 2023. You meticulously check policies for control implementation 
-            and identify compliance gaps.""",
-            verbose=True,
-            allow_delegation=False,
-            llm=self.llm
-        )
+        # Compliance Agent - Maps policies to standards (rebuilt per analysis
+        # for the selected frameworks)
+        self.compliance_agent = self.create_compliance_agent(load_catalog().default_frameworks)
         
         # Recommendation Agent - Generates improvement suggestions
         self.recommendation_agent = Agent(
@@ -73,18 +100,66 @@ class PolicyAnalysisCrew:
             allow_delegation=False,
             llm=self.llm
         )
+        
+        for agent in (self.reader_agent, self.recommendation_agent):
+            guard_llm_calls(agent.llm, self)
+    
+    def create_compliance_agent(self, frameworks: Iterable[Framework]) -> Agent:
+        """Build the compliance auditor for the frameworks being evaluated."""
+        framework_names = ", ".join(framework.name for framework in frameworks)
+        agent = Agent(
+            role="Compliance Standards Auditor",
+            goal=f"Evaluate policies against {framework_names}",
+            backstory=f"""You are a certified compliance auditor specializing in cybersecurity 
+            frameworks. You have deep knowledge of {framework_names}. 
+            You meticulously check policies for control implementation and identify compliance gaps.""",
+            verbose=True,
+            allow_delegation=False,
+            llm=self.llm
+        )
+        guard_llm_calls(agent.llm, self)
+        return agent
     
-    def analyze_policy(self, policy_text: str, premium: bool = False) -> Dict[str, Any]:
+    def analyze_policy(
+        self,
+        policy_text: str,
+        premium: bool = False,
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+        cancel_token: Optional[CancelToken] = None,
+        document_name: Optional[str] = None,
+        frameworks: Optional[Iterable[str]] = None,
+        tenant: Optional[str] = None,
+        record_results: bool = True
+    ) -> Dict[str, Any]:
         """
         Analyze a security policy document.
         
         Args:
             policy_text: The policy document text
             premium: Whether to generate full report with AI recommendations
+            progress_callback: Called with a progress message as each agent starts
+            cancel_token: Checked between tasks and before every LLM call
+            document_name: With the tenant, the key of the document in the
+                control index and of its compliance history (the document_id
+                if not given); a new revision replaces the indexed one
+            frameworks: Ids of the frameworks to evaluate (default frameworks if not given)
+            tenant: Caller whose control index and compliance history the
+                analysis is recorded in
+            record_results: Record the result in the control index and history
             
         Returns:
             Analysis results with score and recommendations
+            
+        Raises:
+            AnalysisCancelled: If the cancel token fired before the run finished
+            ValueError: If a framework id is not in the catalog
         """
+        if cancel_token is not None:
+            cancel_token.check()
+        selected = load_catalog().select(frameworks)
+        framework_ids = [framework.id for framework in selected]
+        self.compliance_agent = self.create_compliance_agent(selected)
+        self.cancel_token = cancel_token
         
         # Task 1: Extract policy sections
         extraction_task = Task(
@@ -114,9 +189,7 @@ class PolicyAnalysisCrew:
             description=f"""
             Based on the policy content, evaluate compliance with:
             
-            1. NIST 800-53 controls (AC-1, AC-2, AU-1, IA-1, IA-2, IR-1, SC-1, CP-1)
-            2. ISO 27001 controls (A.5.1.1, A.9.1.1, A.9.2.1, A.12.1.1, A.16.1.1, A.18.1.1)
-            3. DPDP Act 2023 requirements (Data Principal Rights, Retention, Consent)
+            {framework_checklist(selected)}
             
             Identify which controls are:
             - Fully addressed
@@ -145,12 +218,35 @@ class PolicyAnalysisCrew:
             agent=self.recommendation_agent
         )
         
+        # Progress messages sent when each agent's task begins
+        progress_steps = [
+            {'step': 2, 'message': 'Policy Reader Agent extracting security sections...', 'progress': 35},
+            {'step': 3, 'message': 'Compliance Auditor evaluating standards...', 'progress': 55},
+        ]
+        if premium:
+            progress_steps.append(
+                {'step': 4, 'message': 'AI Consultant generating recommendations...', 'progress': 75}
+            )
+        completed_tasks = 0
+        
+        def report_progress(step_index: int):
+            if progress_callback and step_index < len(progress_steps):
+                progress_callback(progress_steps[step_index])
+        
+        def on_task_complete(task_output):
+            nonlocal completed_tasks
+            completed_tasks += 1
+            if cancel_token is not None:
+                cancel_token.check()
+            report_progress(completed_tasks)
+        
         # Create crew with appropriate tasks
         if premium:
             crew = Crew(
                 agents=[self.reader_agent, self.compliance_agent, self.recommendation_agent],
                 tasks=[extraction_task, compliance_task, recommendation_task],
                 process=Process.sequential,
+                task_callback=on_task_complete,
                 verbose=True
             )
         else:
@@ -158,6 +254,7 @@ class PolicyAnalysisCrew:
                 agents=[self.reader_agent, self.compliance_agent],
                 tasks=[extraction_task, compliance_task],
                 process=Process.sequential,
+                task_callback=on_task_complete,
                 verbose=True
             )
         
@@ -168,24 +265,34 @@ class PolicyAnalysisCrew:
             print(f"DEBUG: First 100 chars: {policy_text[:100]}")
             print(f"DEBUG: Premium mode: {premium}")
             
+            report_progress(0)
             result = crew.kickoff()
             
             print(f"DEBUG: CrewAI execution completed")
+            if cancel_token is not None:
+                cancel_token.check()
             
             # Process results with our tools for structured data
             sections = extract_sections(policy_text)
-            compliance_results = check_compliance(policy_text, sections)
+            compliance_results = check_compliance(policy_text, sections, framework_ids)
+            
+            print(f"DEBUG: Compliance score: {compliance_results.score}")
+            print(f"DEBUG: Strengths found: {compliance_results.count(Status.PRESENT)}")
+            print(f"DEBUG: Gaps found: {compliance_results.count(Status.MISSING)}")
             
-            print(f"DEBUG: Compliance score: {compliance_results['score']}")
-            print(f"DEBUG: Strengths found: {len(compliance_results['strengths'])}")
-            print(f"DEBUG: Gaps found: {len(compliance_results['gaps'])}")
+            document_id = document_fingerprint(policy_text)
+            if record_results:
+                index_compliance(tenant, document_id, compliance_results, document_name)
+                record_history(history_key(tenant, document_name, document_id), document_id, compliance_results)
             
             # Build response
             response = {
                 "success": True,
-                "score": compliance_results["score"],
-                "gaps": compliance_results["gaps"][:10],  # Top 10 gaps
-                "strengths": compliance_results["strengths"][:5],  # Top 5 strengths
+                "document_id": document_id,
+                "frameworks": framework_ids,
+                "score": compliance_results.score,
+                "gaps": compliance_results.labels(Status.MISSING, limit=10),  # Top 10 gaps
+                "strengths": compliance_results.labels(Status.PRESENT, limit=5),  # Top 5 strengths
                 "summary": create_compliance_summary(compliance_results),
                 "sections_found": list(sections.keys())
             }
@@ -195,15 +302,17 @@ class PolicyAnalysisCrew:
                 recommendations = generate_recommendations(compliance_results)
                 response["recommendations"] = recommendations[:10]  # Top 10 recommendations
                 response["ai_analysis"] = str(result)  # Full AI analysis
-                response["compliance_details"] = {
-                    "nist": compliance_results["nist_compliance"],
-                    "iso": compliance_results["iso_compliance"],
-                    "dpdp": compliance_results["dpdp_compliance"]
-                }
+                response["compliance_details"] = compliance_results.compliance_details()
             
             return response
             
+        except AnalysisCancelled:
+            raise
         except Exception as e:
+            # CrewAI may wrap the error raised by a cancelled LLM call
+            if cancel_token is not None and cancel_token.cancelled:
+                raise AnalysisCancelled(cancel_token.reason) from e
+            
             print(f"ERROR in analyze_policy: {e}")
             import traceback
             error_traceback = traceback.format_exc()
@@ -218,6 +327,8 @@ class PolicyAnalysisCrew:
                 "strengths": [],
                 "message": f"Analysis failed: {str(e)}"
             }
+        finally:
+            self.cancel_token = None
 
 def get_policy_crew(api_key: Optional[str] = None, provider: str = "openai"):
     """
@@ -233,7 +344,8 @@ def get_policy_crew(api_key: Optional[str] = None, provider: str = "openai"):
     
     # Initialize LLM based on provider
     if provider == "gemini":
-        if not GEMINI_AVAILABLE:
+        ChatGoogleGenerativeAI = load_gemini_chat_model()
+        if ChatGoogleGenerativeAI is None:
             print("Warning: Gemini not available, falling back to OpenAI")
             # Fall back to OpenAI
             llm = ChatOpenAI(
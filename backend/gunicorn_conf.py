@@ -0,0 +1,41 @@
+"""
+Gunicorn settings for the multi-worker production mode (./run.sh prod).
+
+The app is imported once in the master (preload_app) and the control
+catalog is loaded before workers are forked, so every worker starts with
+the catalog already in memory and shares those pages copy-on-write.
+Cross-worker state lives in the SQLite store (backend/state_store.py).
+"""
+import gc
+
+from backend.config import WEB_CONCURRENCY, BIND_ADDRESS, WARMUP_AI_MODULES
+
+bind = BIND_ADDRESS
+workers = WEB_CONCURRENCY
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 300
+graceful_timeout = 30
+keepalive = 5
+
+
+def when_ready(server):
+    from backend.agents.catalog import load_catalog
+    from backend.state_store import get_store
+
+    catalog = load_catalog()
+    server.log.info("Preloaded control catalog: %d controls", len(catalog))
+
+    # With warm-up enabled, import CrewAI/LLM modules in the master as well
+    # so workers inherit them instead of each paying the import cost.
+    if WARMUP_AI_MODULES:
+        import backend.crew_orchestrator  # noqa: F401
+        server.log.info("Preloaded AI agent modules")
+
+    # Create the schema once, then drop the master's connection so no
+    # SQLite handle is inherited across fork.
+    get_store().close()
+
+    # Move everything loaded so far out of the collector's generations so
+    # that GC passes in the workers do not touch (and copy) shared pages.
+    gc.freeze()
@@ -0,0 +1,102 @@
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from backend.agents.results import ComplianceResult
+from backend.state_store import get_store
+
+DAY_SECONDS = 86400
+WEEK_SECONDS = 7 * DAY_SECONDS
+# The Unix epoch is a Thursday; weekly buckets start on Monday 00:00 UTC
+WEEK_OFFSET = 4 * DAY_SECONDS
+
+# Rollup granularities maintained on every insert
+ROLLUPS = ("day", "week")
+GRANULARITIES = ("raw",) + ROLLUPS
+
+
+def bucket_start(timestamp: float, granularity: str) -> float:
+    """Start (UTC epoch seconds) of the rollup bucket containing a timestamp."""
+    if granularity == "day":
+        return timestamp - timestamp % DAY_SECONDS
+    if granularity == "week":
+        return timestamp - (timestamp - WEEK_OFFSET) % WEEK_SECONDS
+    raise ValueError(f"Unknown rollup granularity: {granularity}")
+
+
+def isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def to_timestamp(value: datetime) -> float:
+    """Epoch seconds of a datetime; naive datetimes are taken as UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def history_key(tenant: Optional[str], document_name: Optional[str], fingerprint: str) -> str:
+    """
+    Key of a document's compliance history.
+
+    Named documents are tracked per tenant, so equally named files of
+    different callers never share a series. Documents without a name are
+    tracked by their fingerprint. Tenant ids never contain "/".
+    """
+    if not document_name:
+        return fingerprint
+    return f"{tenant}/{document_name}" if tenant else document_name
+
+
+def record_history(document: str, fingerprint: str, result: ComplianceResult,
+                   analyzed: Optional[float] = None):
+    """
+    Append an analysis to a document's compliance history.
+
+    Recording is best effort: a failure is logged and never fails the
+    analysis that produced the result.
+    """
+    analyzed = time.time() if analyzed is None else analyzed
+    try:
+        get_store().append_history(
+            document, fingerprint, analyzed, result.score, result.counts(),
+            {granularity: bucket_start(analyzed, granularity) for granularity in ROLLUPS}
+        )
+    except Exception as e:
+        print(f"WARNING: Could not record history for {document}: {e}")
+
+
+def query_history(document: str, start: float, end: float, granularity: str = "day",
+                  limit: int = 1000) -> List[Dict[str, Any]]:
+    """
+    History points of a document between start and end (epoch seconds).
+
+    Rollup granularities read one precomputed row per bucket, so a query
+    costs the same however many analyses a document has had. The "raw"
+    granularity returns individual analyses, at most ``limit`` of them.
+    """
+    store = get_store()
+    if granularity == "raw":
+        return [
+            {
+                "analyzed": isoformat(record["analyzed"]),
+                "document_id": record["fingerprint"],
+                "score": record["score"],
+                "counts": record["counts"],
+            }
+            for record in store.history(document, start, end, limit)
+        ]
+
+    rollups = store.history_rollups(document, granularity, bucket_start(start, granularity), end)
+    return [
+        {
+            "bucket": isoformat(rollup["bucket"]),
+            "analyses": rollup["analyses"],
+            "avg_score": round(rollup["score_sum"] / rollup["analyses"], 1),
+            "min_score": rollup["score_min"],
+            "max_score": rollup["score_max"],
+            "last_score": rollup["last_score"],
+            "counts": rollup["last_counts"],
+        }
+        for rollup in rollups
+    ]
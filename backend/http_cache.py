@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from backend.json_codec import dumps_bytes
+
+# Brotli compresses JSON noticeably better than gzip; it is optional and
+# gzip is used when it is not installed.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+# Quality 11 is too slow for on-the-fly compression
+BROTLI_QUALITY = 5
+
+
+def result_id(cache_key: str) -> str:
+    """Id of an analysis result in /results/{id}, derived from its result cache key."""
+    return hashlib.sha256(cache_key.encode()).hexdigest()[:32]
+
+
+def result_etag(cache_key: str) -> str:
+    """
+    ETag of an analysis result, derived from its result cache key.
+
+    Weak, because the same result may be sent with different content
+    encodings.
+    """
+    return 'W/"' + result_id(cache_key) + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match header matches an ETag (weak comparison)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header, honouring q-values."""
+    if not accept_encoding:
+        return None
+
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+
+    default = weights.get("*", 0.0)
+    supported = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_weight = None, 0.0
+    for coding in supported:
+        weight = weights.get(coding, default)
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def not_modified(etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    """304 for a GET whose If-None-Match matched; varies like the full response."""
+    return Response(status_code=304, headers={**(headers or {}), "ETag": etag, "Vary": "Accept-Encoding"})
+
+
+def precondition_failed(etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    412 for a POST whose If-None-Match matched.
+
+    RFC 9110 reserves 304 for GET and HEAD; other methods are refused with
+    412 instead of being performed.
+    """
+    return Response(status_code=412, headers={**(headers or {}), "ETag": etag})
+
+
+def json_result_response(request: Request, content: Any, etag: Optional[str] = None,
+                         headers: Optional[Dict[str, str]] = None,
+                         status_code: int = 200) -> Response:
+    """
+    JSON response compressed with the best encoding the client accepts.
+
+    Used per endpoint rather than as middleware so event streams are never
+    buffered by a compressor.
+    """
+    body = dumps_bytes(content)
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    if etag is not None:
+        headers["ETag"] = etag
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding is not None and len(body) >= COMPRESS_MIN_BYTES:
+        if encoding == "br":
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+        else:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        headers["Content-Encoding"] = encoding
+
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
@@ -0,0 +1,316 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from backend.cancellation import CancelToken, CLIENT_DISCONNECTED
+from backend.config import (
+    SSE_HEARTBEAT_SECONDS,
+    JOB_RETENTION_SECONDS,
+    ANALYSIS_DEADLINE_SECONDS,
+    STREAM_RESUME_GRACE_SECONDS,
+)
+from backend.json_codec import dumps as json_dumps
+from backend.state_store import get_store
+
+# How long past its deadline a job owned by another worker may keep
+# running before readers give up on it; the owner only notices the
+# deadline at its next LLM call.
+LOST_JOB_GRACE_SECONDS = 60.0
+# How often a stream replaying another worker's job re-reads the store
+STORED_JOB_POLL_SECONDS = 0.25
+
+Event = Tuple[int, Dict[str, Any]]
+
+# Job rows and events are written by one thread, in order: publishing
+# never waits on the store (whose busy timeout can be long), even from the
+# event loop, and a reader on another worker never sees a job finish
+# before its final event is stored.
+_store_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+
+
+def _write(method: str, *args: Any):
+    try:
+        getattr(get_store(), method)(*args)
+    except Exception as e:
+        print(f"Job store write {method} failed: {e}")
+
+
+def write_store(method: str, *args: Any):
+    """Queue a write of job state to the shared store."""
+    _store_writer.submit(_write, method, *args)
+
+
+class AnalysisJob:
+    """
+    Ordered, replayable event buffer for one analysis.
+
+    Events are numbered from 1. Producers publish from any thread; SSE
+    subscribers are woken through their event loop as soon as an event
+    arrives, so streaming needs no polling or fixed sleeps. Events are also
+    written to the shared store so another worker can replay them.
+
+    The job's cancel token fires when its deadline passes or when every
+    subscriber is gone: at once if the last one to leave cannot resume (a
+    JSON request), otherwise after STREAM_RESUME_GRACE_SECONDS.
+    """
+
+    def __init__(self, job_id: str, cancel_token: Optional[CancelToken] = None):
+        self.id = job_id
+        self.cancel_token = cancel_token or CancelToken()
+        self.finished = False
+        self.finished_at: Optional[float] = None
+        self._events: List[Event] = []
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def publish(self, message: Dict[str, Any], final: bool = False) -> bool:
+        """Append an event; returns False if the job had already finished."""
+        with self._lock:
+            if self.finished:
+                return False
+            seq = len(self._events) + 1
+            self._events.append((seq, message))
+            if final:
+                self.finished = True
+                self.finished_at = time.time()
+            subscribers = list(self._subscribers)
+
+        write_store("append_job_event", self.id, seq, message)
+        for loop, wake in subscribers:
+            loop.call_soon_threadsafe(wake.set)
+        return True
+
+    def complete(self, result: Dict[str, Any]):
+        """Publish the final result and record the job outcome."""
+        status = "done" if result and result.get("success", True) else "failed"
+        # Publish first so the final event is stored before the status changes
+        if self.publish({"complete": True, "result": result, "progress": 100}, final=True):
+            write_store("update_job", self.id, status, result)
+
+    def fail(self, error: str, **details: Any):
+        message = {"error": error, **details}
+        if self.publish(message, final=True):
+            write_store("update_job", self.id, "failed", message)
+
+    def cancel(self, reason: str):
+        """Stop the analysis at its next checkpoint and end the stream."""
+        if not self.finished:
+            self.cancel_token.cancel(reason)
+            self.fail(f"Analysis cancelled: {reason}", cancelled=reason)
+
+    async def final_event(self) -> Dict[str, Any]:
+        """Wait for the job to finish and return its last event."""
+        final = None
+        async for event in self.events(heartbeat=None, resumable=False):
+            final = event
+        return final[1]
+
+    def _cancel_if_abandoned(self):
+        with self._lock:
+            abandoned = not self._subscribers and not self.finished
+        if abandoned:
+            self.cancel(CLIENT_DISCONNECTED)
+
+    async def events(self, after: int = 0,
+                     heartbeat: Optional[float] = SSE_HEARTBEAT_SECONDS,
+                     resumable: bool = True) -> AsyncIterator[Optional[Event]]:
+        """
+        Yield events with a sequence number greater than ``after``.
+
+        Yields None when nothing happened for ``heartbeat`` seconds (never,
+        if heartbeat is None), and returns once the final event has been
+        delivered. A subscriber that is not ``resumable`` cannot reconnect,
+        so the run is cancelled as soon as it leaves as the last one.
+        """
+        wake = asyncio.Event()
+        subscriber = (asyncio.get_running_loop(), wake)
+        with self._lock:
+            self._subscribers.add(subscriber)
+
+        try:
+            while True:
+                with self._lock:
+                    # Clear before reading so a publish after this point
+                    # always leaves the event set.
+                    wake.clear()
+                    pending = self._events[after:]
+                    finished = self.finished
+
+                for event in pending:
+                    after = event[0]
+                    yield event
+
+                if pending:
+                    continue
+                if finished:
+                    return
+
+                try:
+                    await asyncio.wait_for(wake.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+                abandoned = not self._subscribers and not self.finished
+            if abandoned and not resumable:
+                self.cancel(CLIENT_DISCONNECTED)
+            elif abandoned:
+                # Give the client a chance to reconnect with Last-Event-ID
+                subscriber[0].call_later(STREAM_RESUME_GRACE_SECONDS, self._cancel_if_abandoned)
+
+
+class JobRegistry:
+    """
+    In-process analysis jobs, kept for JOB_RETENTION_SECONDS after they finish.
+
+    Running jobs can be registered under a flight key (document hash, tier
+    and provider) so that identical concurrent requests share one run.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, AnalysisJob] = {}
+        self._flights: Dict[str, AnalysisJob] = {}
+        self._lock = threading.Lock()
+
+    def create(self, payload: Dict[str, Any]) -> AnalysisJob:
+        with self._lock:
+            return self._create(payload)
+
+    def start_or_join(self, flight_key: str, payload: Dict[str, Any]) -> Tuple[AnalysisJob, bool]:
+        """
+        Get the running job for this flight key, or create one.
+
+        Returns the job and whether it was created by this call, in which
+        case the caller is responsible for running the analysis.
+        """
+        with self._lock:
+            job = self._flights.get(flight_key)
+            if job is not None and not job.finished:
+                return job, False
+            job = self._create(payload)
+            self._flights[flight_key] = job
+            return job, True
+
+    def flight(self, flight_key: str) -> Optional[AnalysisJob]:
+        """The running job for this flight key, if any."""
+        with self._lock:
+            job = self._flights.get(flight_key)
+            return job if job is not None and not job.finished else None
+
+    def _create(self, payload: Dict[str, Any]) -> AnalysisJob:
+        job_id = uuid.uuid4().hex
+        write_store("create_job", "analysis", payload, "running", job_id)
+        job = AnalysisJob(job_id, CancelToken(ANALYSIS_DEADLINE_SECONDS))
+        self._prune()
+        self._jobs[job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        for flight_key in [key for key, job in self._flights.items() if job.finished]:
+            del self._flights[flight_key]
+        if expired:
+            write_store("purge_jobs", "analysis", cutoff)
+
+
+jobs = JobRegistry()
+
+
+def format_sse(event: Optional[Event]) -> str:
+    if event is None:
+        return ": keep-alive\n\n"
+    seq, message = event
+    return f"id: {seq}\ndata: {json_dumps(message)}\n\n"
+
+
+async def stream_job(job: AnalysisJob, after: int = 0) -> AsyncIterator[str]:
+    async for event in job.events(after):
+        yield format_sse(event)
+
+
+def worker_alive(pid: Optional[int]) -> bool:
+    """Whether the worker process that owns a job is still running."""
+    if pid is None:
+        return True
+    if pid == os.getpid():
+        # Stored jobs are only read when this process does not hold the
+        # job, so the owner was an earlier process with the same pid.
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fail_lost_job(job: Dict[str, Any]) -> bool:
+    """
+    Fail a stored running job whose owner died or overran its deadline.
+
+    Returns True if the job was lost; it is then marked failed in the store
+    with a final error event.
+    """
+    if job["kind"] != "analysis" or job["status"] != "running":
+        return False
+    if not worker_alive(job["worker"]):
+        reason = "worker stopped"
+    elif ANALYSIS_DEADLINE_SECONDS and \
+            time.time() > job["created"] + ANALYSIS_DEADLINE_SECONDS + LOST_JOB_GRACE_SECONDS:
+        reason = "deadline exceeded"
+    else:
+        return False
+    get_store().fail_running_job(job["id"], {"error": f"Analysis lost: {reason}", "lost": reason})
+    return True
+
+
+async def stream_stored_job(job_id: str, after: int = 0,
+                            heartbeat: float = SSE_HEARTBEAT_SECONDS) -> AsyncIterator[str]:
+    """
+    Replay a job owned by another worker from the shared store.
+
+    Other workers cannot wake this one, so while the job is still running
+    the store is re-read every STORED_JOB_POLL_SECONDS, and a keep-alive
+    is sent when nothing was sent for ``heartbeat`` seconds. A job whose
+    worker died or that overran its deadline is failed and the stream ends.
+    """
+    store = get_store()
+    last_sent = time.monotonic()
+    while True:
+        job = await asyncio.to_thread(store.get_job, job_id)
+        if job is None:
+            return
+        if await asyncio.to_thread(fail_lost_job, job):
+            continue
+        running = job["status"] == "running"
+
+        events = await asyncio.to_thread(store.job_events, job_id, after)
+        for seq, message in events:
+            after = seq
+            yield format_sse((seq, message))
+            if message.get("complete") or message.get("error"):
+                return
+
+        if not running:
+            return
+        if events:
+            last_sent = time.monotonic()
+            continue
+        if time.monotonic() - last_sent >= heartbeat:
+            yield format_sse(None)
+            last_sent = time.monotonic()
+        await asyncio.sleep(STORED_JOB_POLL_SECONDS)
@@ -0,0 +1,127 @@
+import cProfile
+import hmac
+import io
+import marshal
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+from backend.config import ADMIN_TOKEN, PROFILE_SAMPLE_RATE, PROFILE_RETENTION_SECONDS
+from backend.state_store import get_store
+
+# Functions listed in a profile summary, by cumulative time
+PROFILE_TOP_FUNCTIONS = 40
+
+# cProfile (sys.monitoring on Python 3.12+) and tracemalloc are
+# process-wide, so only one analysis is profiled at a time
+_profile_lock = threading.Lock()
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Whether a token matches ADMIN_TOKEN; always False when no token is configured."""
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def sampled() -> bool:
+    """Pick a request for profiling at PROFILE_SAMPLE_RATE."""
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def top_functions(stats: pstats.Stats, limit: int = PROFILE_TOP_FUNCTIONS) -> List[Dict[str, Any]]:
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            "function": f"{filename}:{line}({name})",
+            "calls": calls,
+            "total_seconds": round(total, 6),
+            "cumulative_seconds": round(cumulative, 6),
+        }
+        for (filename, line, name), (_, calls, total, cumulative, _) in rows
+    ]
+
+
+class RequestProfiler:
+    """
+    Profile one analysis with cProfile and tracemalloc and store the result.
+
+    cProfile covers the thread that enters the profiler. The tracemalloc
+    peak is process-wide, so it also counts allocations of concurrent
+    unprofiled requests. Only one profile runs at a time: an analysis that
+    starts while another is profiled, or while another profiling tool is
+    active, runs unprofiled and its stored profile says why.
+    """
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self._profiler = cProfile.Profile()
+        self._started = 0.0
+        self._active = False
+        self._owns_tracemalloc = False
+
+    def __enter__(self):
+        if not _profile_lock.acquire(blocking=False):
+            self._skip("another analysis was being profiled")
+            return self
+        try:
+            self._profiler.enable()
+        except ValueError as e:
+            # Another profiler or debugger holds sys.monitoring (Python 3.12+)
+            _profile_lock.release()
+            self._skip(str(e))
+            return self
+        self._active = True
+        # Leave tracing started by someone else (PYTHONTRACEMALLOC) running
+        self._owns_tracemalloc = not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+        self._started = time.perf_counter()
+        return self
+
+    def _skip(self, reason: str):
+        print(f"WARNING: Analysis {self.request_id} not profiled: {reason}")
+        try:
+            summary = {"request_id": self.request_id, "skipped": reason, "report": f"Not profiled: {reason}\n"}
+            get_store().save_profile(self.request_id, summary, marshal.dumps({}), PROFILE_RETENTION_SECONDS)
+        except Exception as e:
+            print(f"WARNING: Could not save profile {self.request_id}: {e}")
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self._active:
+            return False
+        self._active = False
+        wall_seconds = time.perf_counter() - self._started
+        self._profiler.disable()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+        _profile_lock.release()
+
+        try:
+            self._profiler.create_stats()
+            # Serialize first: building a Stats object empties the profiler's stats
+            raw_stats = marshal.dumps(self._profiler.stats)
+            output = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=output)
+            stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+            summary = {
+                "request_id": self.request_id,
+                "wall_seconds": round(wall_seconds, 6),
+                "peak_memory_bytes": peak_memory,
+                "error": repr(exc) if exc is not None else None,
+                "top_functions": top_functions(stats),
+                "report": output.getvalue(),
+            }
+            get_store().save_profile(
+                self.request_id, summary, raw_stats,
+                PROFILE_RETENTION_SECONDS
+            )
+        except Exception as e:
+            print(f"WARNING: Could not save profile {self.request_id}: {e}")
+        return False
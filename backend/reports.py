@@ -0,0 +1,145 @@
+"""
+Premium report rendering.
+
+Premium analyses queue a "report" job in the shared store. A renderer
+(a thread in each API worker, or ``python -m backend.reports``) claims
+queued jobs, renders the result to HTML, and to PDF when weasyprint is
+installed, and stores each artifact on disk under its SHA-256.
+"""
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from backend.config import REPORTS_DIR, REPORT_POLL_SECONDS, RESULT_CACHE_TTL
+from backend.state_store import get_store
+
+# PDF output is optional; weasyprint raises OSError when its system
+# libraries are missing.
+try:
+    from weasyprint import HTML
+except (ImportError, OSError):
+    HTML = None
+
+REPORT_JOB_KIND = "report"
+REPORT_TEMPLATE = "premium_report.html"
+REPORT_MEDIA_TYPES = {"html": "text/html; charset=utf-8", "pdf": "application/pdf"}
+
+_environment = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), "templates")),
+    autoescape=select_autoescape(["html"]),
+)
+# Set when a report is queued by this process, so the renderer starts
+# right away instead of at its next poll.
+_queued = threading.Event()
+_renderer: Optional[threading.Thread] = None
+_renderer_lock = threading.Lock()
+
+
+def report_url(report_id: str) -> str:
+    return f"/reports/{report_id}"
+
+
+def enqueue_report(cache_key: str, result: Dict[str, Any],
+                   document_name: Optional[str] = None) -> Dict[str, str]:
+    """
+    Queue rendering of a premium result and return its report reference.
+
+    Only a job row is written, so this never delays the analysis response.
+    A result that was already queued returns the existing reference.
+    """
+    store = get_store()
+    reference_key = f"report:{cache_key}"
+    reference = store.cache_get(reference_key)
+    if reference is not None:
+        return reference
+
+    report_id = store.create_job(
+        REPORT_JOB_KIND,
+        payload={"result": result, "document_name": document_name or "policy"},
+        status="queued"
+    )
+    reference = {"id": report_id, "url": report_url(report_id)}
+    store.cache_set(reference_key, reference, RESULT_CACHE_TTL)
+    _queued.set()
+    return reference
+
+
+def artifact_path(digest: str, fmt: str) -> str:
+    return os.path.join(REPORTS_DIR, digest[:2], f"{digest}.{fmt}")
+
+
+def store_artifact(data: bytes, fmt: str) -> Dict[str, Any]:
+    """Write an artifact under its content hash; identical content is stored once."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = artifact_path(digest, fmt)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+    return {"sha256": digest, "size": len(data)}
+
+
+def render_report(payload: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Render a queued report; returns the stored artifacts by format."""
+    html = _environment.get_template(REPORT_TEMPLATE).render(
+        result=payload["result"],
+        document_name=payload["document_name"],
+    )
+    artifacts = {"html": store_artifact(html.encode("utf-8"), "html")}
+    if HTML is not None:
+        artifacts["pdf"] = store_artifact(HTML(string=html).write_pdf(), "pdf")
+    return artifacts
+
+
+def render_pending() -> int:
+    """Render queued reports until none are left; returns how many were claimed."""
+    store = get_store()
+    claimed = 0
+    while True:
+        job = store.claim_job(REPORT_JOB_KIND)
+        if job is None:
+            return claimed
+        claimed += 1
+        try:
+            store.update_job(job["id"], "done", {"artifacts": render_report(job["payload"])})
+        except Exception as e:
+            print(f"ERROR rendering report {job['id']}: {e}")
+            store.update_job(job["id"], "failed", {"error": str(e)})
+
+
+def run_renderer(stop: Optional[threading.Event] = None):
+    """Render reports as they are queued, by any worker, until stopped."""
+    while stop is None or not stop.is_set():
+        _queued.clear()
+        try:
+            render_pending()
+        except Exception as e:
+            print(f"ERROR in report renderer: {e}")
+        _queued.wait(REPORT_POLL_SECONDS)
+
+
+def start_renderer():
+    """Start the background renderer thread of this process, once."""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = threading.Thread(target=run_renderer, name="report-renderer", daemon=True)
+            _renderer.start()
+
+
+def get_report(report_id: str) -> Optional[Dict[str, Any]]:
+    """The report job, or None if there is no report with this id."""
+    job = get_store().get_job(report_id)
+    if job is None or job["kind"] != REPORT_JOB_KIND:
+        return None
+    return job
+
+
+if __name__ == "__main__":
+    print(f"Rendering reports into {REPORTS_DIR} (PDF {'enabled' if HTML else 'disabled'})")
+    run_renderer()
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from backend.config import (
+    ANALYSIS_CONCURRENCY,
+    MAX_QUEUED_PER_TENANT,
+    PREMIUM_WEIGHT,
+    RATE_LIMIT_PER_MINUTE,
+    RATE_LIMIT_BURST,
+    PREMIUM_RATE_LIMIT_PER_MINUTE,
+    PREMIUM_RATE_LIMIT_BURST,
+)
+from backend.state_store import get_store
+
+# Initial estimate of one crew run, refined as runs complete
+DEFAULT_RUN_SECONDS = 30.0
+# How often each process deletes rate limit buckets that have refilled
+RATE_LIMIT_PURGE_SECONDS = 60.0
+
+_next_rate_limit_purge = 0.0
+
+
+class RateLimited(Exception):
+    """The tenant has to wait ``retry_after`` seconds before its next analysis."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+def tenant_id(client_ip: Optional[str], verified_payment_id: Optional[str] = None) -> str:
+    """
+    Identify the caller: by verified payment id, otherwise by client IP.
+
+    Only a payment id that passed verification for a premium request may
+    be used; anything a client can make up per request (an unchecked
+    payment id or custom API key) would give it a fresh bucket every time.
+    """
+    if verified_payment_id:
+        return "payment:" + hashlib.sha256(verified_payment_id.encode()).hexdigest()[:16]
+    return "ip:" + (client_ip or "unknown")
+
+
+def tenant_weight(premium: bool) -> float:
+    return PREMIUM_WEIGHT if premium else 1.0
+
+
+def _rate_limit_tiers() -> List[Tuple[str, float, int]]:
+    """(tier, tokens per second, burst) of each enabled tier."""
+    tiers = [
+        ("free", RATE_LIMIT_PER_MINUTE / 60.0, RATE_LIMIT_BURST),
+        ("premium", PREMIUM_RATE_LIMIT_PER_MINUTE / 60.0, PREMIUM_RATE_LIMIT_BURST),
+    ]
+    return [tier for tier in tiers if tier[1] > 0]
+
+
+def purge_idle_rate_limits():
+    """
+    Delete buckets idle long enough to have refilled, at most once per
+    RATE_LIMIT_PURGE_SECONDS in this process.
+
+    A full bucket behaves exactly like a missing one, so this only bounds
+    the table and never hands out extra tokens.
+    """
+    global _next_rate_limit_purge
+    now = time.monotonic()
+    if now < _next_rate_limit_purge:
+        return
+    _next_rate_limit_purge = now + RATE_LIMIT_PURGE_SECONDS
+    tiers = _rate_limit_tiers()
+    if tiers:
+        refill_seconds = max(burst / rate for _, rate, burst in tiers)
+        get_store().purge_rate_limits(time.time() - refill_seconds)
+
+
+def check_rate_limit(tenant: str, premium: bool):
+    """Take a token from the tenant's bucket for its tier, or raise RateLimited."""
+    purge_idle_rate_limits()
+    if premium:
+        per_minute, burst, tier = PREMIUM_RATE_LIMIT_PER_MINUTE, PREMIUM_RATE_LIMIT_BURST, "premium"
+    else:
+        per_minute, burst, tier = RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST, "free"
+    if per_minute <= 0:
+        return
+
+    wait = get_store().take_token(f"{tenant}:{tier}", per_minute / 60.0, burst)
+    if wait:
+        raise RateLimited(
+            f"Rate limit exceeded: {per_minute:g} {tier} analyses per minute",
+            wait
+        )
+
+
+class FairScheduler:
+    """
+    Weighted fair queue in front of crew runs in this worker.
+
+    At most ``slots`` runs execute at once. When all slots are busy, runs
+    wait in a queue ordered by virtual finish time: each tenant's request
+    finishes 1/weight after the later of the tenant's previous request and
+    the current virtual time. A tenant with many queued requests therefore
+    only gets its fair share of slots, and a premium request (weight
+    PREMIUM_WEIGHT) counts as a fraction of a free one.
+
+    The scheduler is only used from the worker's event loop thread.
+    """
+
+    def __init__(self, slots: int = ANALYSIS_CONCURRENCY,
+                 max_queued_per_tenant: int = MAX_QUEUED_PER_TENANT):
+        self.slots = max(1, slots)
+        self.max_queued_per_tenant = max_queued_per_tenant
+        self.running = 0
+        self.average_run_seconds = DEFAULT_RUN_SECONDS
+        self._queue: List[Tuple[float, int, str, asyncio.Future]] = []
+        self._queued: Counter = Counter()
+        self._last_finish: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._order = itertools.count()
+
+    @property
+    def busy(self) -> bool:
+        return self.running >= self.slots or bool(self._queue)
+
+    def estimated_wait(self) -> float:
+        """Rough seconds until a request queued now would start."""
+        waiting = sum(self._queued.values())
+        rounds = waiting // self.slots + 1
+        return rounds * self.average_run_seconds
+
+    def check(self, tenant: str):
+        """Raise RateLimited if the tenant already has too many queued runs."""
+        if self.busy and self._queued[tenant] >= self.max_queued_per_tenant:
+            raise RateLimited(
+                f"Too many queued analyses (max {self.max_queued_per_tenant})",
+                self.estimated_wait()
+            )
+
+    async def acquire(self, tenant: str, weight: float = 1.0):
+        """Wait for a run slot; every acquire must be paired with release()."""
+        if not self.busy:
+            self.running += 1
+            return
+
+        start = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+        finish = start + 1.0 / weight
+        self._last_finish[tenant] = finish
+        granted = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (finish, next(self._order), tenant, granted))
+        self._queued[tenant] += 1
+        # Slots may be free if only cancelled waiters were queued
+        self._dispatch()
+
+        try:
+            await granted
+        except asyncio.CancelledError:
+            if granted.done() and not granted.cancelled():
+                # The slot was granted just before the waiter was cancelled
+                self.release()
+            else:
+                granted.cancel()
+                self._dequeued(tenant)
+            raise
+
+    def release(self, run_seconds: Optional[float] = None):
+        if run_seconds is not None:
+            self.average_run_seconds = 0.8 * self.average_run_seconds + 0.2 * run_seconds
+        self.running -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.running < self.slots and self._queue:
+            finish, _, tenant, granted = heapq.heappop(self._queue)
+            if granted.cancelled():
+                continue
+            self._dequeued(tenant)
+            self._virtual_time = finish
+            self.running += 1
+            granted.set_result(None)
+
+    def _dequeued(self, tenant: str):
+        self._queued[tenant] -= 1
+        if self._queued[tenant] <= 0:
+            del self._queued[tenant]
+            self._last_finish.pop(tenant, None)
+
+
+scheduler = FairScheduler()
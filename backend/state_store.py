@@ -0,0 +1,478 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from backend import json_codec
+from backend.config import STATE_DB_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS result_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    created REAL NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS payments (
+    payment_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    verified_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT,
+    result TEXT,
+    worker INTEGER,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_kind_status ON jobs (kind, status, created);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE TABLE IF NOT EXISTS documents (
+    tenant TEXT NOT NULL,
+    document TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    analyzed REAL NOT NULL,
+    PRIMARY KEY (tenant, document)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS document_scores (
+    tenant TEXT NOT NULL,
+    document TEXT NOT NULL,
+    framework TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    analyzed REAL NOT NULL,
+    PRIMARY KEY (tenant, document, framework)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS control_index (
+    framework TEXT NOT NULL,
+    control_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    tenant TEXT NOT NULL,
+    document TEXT NOT NULL,
+    keyword TEXT,
+    hit_offset INTEGER,
+    PRIMARY KEY (framework, control_id, status, tenant, document)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS control_index_document ON control_index (tenant, document);
+CREATE TABLE IF NOT EXISTS analysis_history (
+    document TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    analyzed REAL NOT NULL,
+    score INTEGER NOT NULL,
+    counts TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analysis_history_document ON analysis_history (document, analyzed);
+CREATE TABLE IF NOT EXISTS history_rollups (
+    document TEXT NOT NULL,
+    granularity TEXT NOT NULL,
+    bucket REAL NOT NULL,
+    analyses INTEGER NOT NULL,
+    score_sum INTEGER NOT NULL,
+    score_min INTEGER NOT NULL,
+    score_max INTEGER NOT NULL,
+    last_analyzed REAL NOT NULL,
+    last_score INTEGER NOT NULL,
+    last_counts TEXT NOT NULL,
+    PRIMARY KEY (document, granularity, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS profiles (
+    request_id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    summary TEXT NOT NULL,
+    stats BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    bucket TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+class StateStore:
+    """
+    SQLite (WAL mode) store shared by all worker processes on a host.
+
+    Holds the analysis result cache, the verified payment ledger, job
+    state, rate limit buckets, the control index of analyzed documents,
+    their compliance history and request profiles. Each thread gets its own connection, and connections are
+    reopened after a fork so workers never share a handle with the master.
+    """
+
+    def __init__(self, path: str = STATE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # Result cache
+
+    def cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT value, expires FROM result_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row["expires"] < time.time():
+            self._conn().execute("DELETE FROM result_cache WHERE key = ?", (key,))
+            return None
+        return json_codec.loads(row["value"])
+
+    def cache_set(self, key: str, value: Dict[str, Any], ttl: float):
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO result_cache (key, value, created, expires) VALUES (?, ?, ?, ?)",
+            (key, json_codec.dumps(value), now, now + ttl),
+        )
+
+    # Payment ledger
+
+    def payment_status(self, payment_id: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT status FROM payments WHERE payment_id = ?", (payment_id,)
+        ).fetchone()
+        return row["status"] if row else None
+
+    def record_payment(self, payment_id: str, status: str):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO payments (payment_id, status, verified_at) VALUES (?, ?, ?)",
+            (payment_id, status, time.time()),
+        )
+
+    # Control index
+
+    def index_document(self, tenant: str, document: str, fingerprint: str, scores: Dict[str, int],
+                       postings: Iterable[Tuple[str, str, str, Optional[str], Optional[int]]]):
+        """
+        Record a tenant's document in the control index.
+
+        ``document`` is the document's name, or its fingerprint if it has
+        none. ``scores`` are its scores per evaluated framework, and
+        ``postings`` (framework, control_id, status, keyword, offset) rows,
+        one per evaluated control. A document indexed with another
+        fingerprint was revised: all entries of the earlier revision are
+        replaced. Otherwise entries of frameworks not evaluated are kept.
+        """
+        postings = list(postings)
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            previous = conn.execute(
+                "SELECT fingerprint FROM documents WHERE tenant = ? AND document = ?",
+                (tenant, document),
+            ).fetchone()
+            if previous is not None and previous["fingerprint"] != fingerprint:
+                conn.execute("DELETE FROM control_index WHERE tenant = ? AND document = ?", (tenant, document))
+                conn.execute("DELETE FROM document_scores WHERE tenant = ? AND document = ?", (tenant, document))
+            else:
+                conn.executemany(
+                    "DELETE FROM control_index "
+                    "WHERE framework = ? AND control_id = ? AND tenant = ? AND document = ?",
+                    [(framework, control_id, tenant, document) for framework, control_id, _, _, _ in postings],
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (tenant, document, fingerprint, analyzed) VALUES (?, ?, ?, ?)",
+                (tenant, document, fingerprint, now),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO document_scores (tenant, document, framework, score, analyzed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(tenant, document, framework, score, now) for framework, score in scores.items()],
+            )
+            conn.executemany(
+                "INSERT INTO control_index (framework, control_id, status, tenant, document, keyword, hit_offset) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(framework, control_id, status, tenant, document, keyword, offset)
+                 for framework, control_id, status, keyword, offset in postings],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def query_control_index(self, tenant: str, framework: str, control_id: str, status: str,
+                            after: str = "", limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        A tenant's documents with a framework's control in the given status,
+        ordered by document after ``after``, with their score in that framework.
+        """
+        rows = self._conn().execute(
+            "SELECT c.document, d.fingerprint, s.score, s.analyzed, c.keyword, c.hit_offset "
+            "FROM control_index c "
+            "JOIN documents d ON d.tenant = c.tenant AND d.document = c.document "
+            "LEFT JOIN document_scores s "
+            "ON s.tenant = c.tenant AND s.document = c.document AND s.framework = c.framework "
+            "WHERE c.framework = ? AND c.control_id = ? AND c.status = ? AND c.tenant = ? AND c.document > ? "
+            "ORDER BY c.document LIMIT ?",
+            (framework, control_id, status, tenant, after, limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count_control_index(self, tenant: str, framework: str, control_id: str, status: str) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM control_index "
+            "WHERE framework = ? AND control_id = ? AND status = ? AND tenant = ?",
+            (framework, control_id, status, tenant),
+        ).fetchone()[0]
+
+    # Compliance history
+
+    def append_history(self, document: str, fingerprint: str, analyzed: float, score: int,
+                       counts: Dict[str, Any], buckets: Dict[str, float]):
+        """
+        Append an analysis to a document's history and fold it into its rollups.
+
+        ``buckets`` maps each rollup granularity to the start of the bucket
+        the analysis falls in.
+        """
+        encoded_counts = json_codec.dumps(counts)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO analysis_history (document, fingerprint, analyzed, score, counts) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (document, fingerprint, analyzed, score, encoded_counts),
+            )
+            conn.executemany(
+                "INSERT INTO history_rollups (document, granularity, bucket, analyses, score_sum, "
+                "score_min, score_max, last_analyzed, last_score, last_counts) "
+                "VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (document, granularity, bucket) DO UPDATE SET "
+                "analyses = analyses + 1, score_sum = score_sum + excluded.score_sum, "
+                "score_min = MIN(score_min, excluded.score_min), "
+                "score_max = MAX(score_max, excluded.score_max), "
+                "last_score = CASE WHEN excluded.last_analyzed >= last_analyzed "
+                "THEN excluded.last_score ELSE last_score END, "
+                "last_counts = CASE WHEN excluded.last_analyzed >= last_analyzed "
+                "THEN excluded.last_counts ELSE last_counts END, "
+                "last_analyzed = MAX(last_analyzed, excluded.last_analyzed)",
+                [(document, granularity, bucket, score, score, score, analyzed, score, encoded_counts)
+                 for granularity, bucket in buckets.items()],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def history(self, document: str, start: float, end: float, limit: int) -> List[Dict[str, Any]]:
+        """Raw history records of a document with start <= analyzed < end."""
+        rows = self._conn().execute(
+            "SELECT fingerprint, analyzed, score, counts FROM analysis_history "
+            "WHERE document = ? AND analyzed >= ? AND analyzed < ? ORDER BY analyzed LIMIT ?",
+            (document, start, end, limit),
+        ).fetchall()
+        return [{**dict(row), "counts": json_codec.loads(row["counts"])} for row in rows]
+
+    def history_rollups(self, document: str, granularity: str,
+                        start: float, end: float) -> List[Dict[str, Any]]:
+        """Rollup buckets of a document with start <= bucket < end."""
+        rows = self._conn().execute(
+            "SELECT bucket, analyses, score_sum, score_min, score_max, last_score, last_counts "
+            "FROM history_rollups WHERE document = ? AND granularity = ? AND bucket >= ? AND bucket < ? "
+            "ORDER BY bucket",
+            (document, granularity, start, end),
+        ).fetchall()
+        return [{**dict(row), "last_counts": json_codec.loads(row["last_counts"])} for row in rows]
+
+    # Profiles
+
+    def save_profile(self, request_id: str, summary: Dict[str, Any], stats: bytes,
+                     retention: float):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("DELETE FROM profiles WHERE created < ?", (now - retention,))
+        conn.execute(
+            "INSERT OR REPLACE INTO profiles (request_id, created, summary, stats) VALUES (?, ?, ?, ?)",
+            (request_id, now, json_codec.dumps(summary), stats),
+        )
+
+    def get_profile(self, request_id: str) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        """The (summary, marshalled pstats data) of a profile."""
+        row = self._conn().execute(
+            "SELECT summary, stats FROM profiles WHERE request_id = ?", (request_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json_codec.loads(row["summary"]), row["stats"]
+
+    # Rate limits
+
+    def take_token(self, bucket: str, rate: float, burst: int) -> float:
+        """
+        Take one token from a token bucket refilled at ``rate`` tokens per second.
+
+        Returns 0 if a token was taken, otherwise the seconds until one will
+        be available.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated FROM rate_limits WHERE bucket = ?", (bucket,)
+            ).fetchone()
+            now = time.time()
+            tokens = float(burst) if row is None else min(burst, row["tokens"] + (now - row["updated"]) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits (bucket, tokens, updated) VALUES (?, ?, ?)",
+                (bucket, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def purge_rate_limits(self, idle_before: float):
+        """Delete buckets not used since ``idle_before``."""
+        self._conn().execute("DELETE FROM rate_limits WHERE updated < ?", (idle_before,))
+
+    # Jobs
+
+    def create_job(self, kind: str, payload: Optional[Dict[str, Any]] = None,
+                   status: str = "queued", job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        # A job created running is owned by this process
+        worker = os.getpid() if status == "running" else None
+        self._conn().execute(
+            "INSERT INTO jobs (id, kind, status, payload, worker, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, status, json_codec.dumps(payload) if payload is not None else None, worker, now, now),
+        )
+        return job_id
+
+    def claim_job(self, kind: str) -> Optional[Dict[str, Any]]:
+        """Atomically move the oldest queued job of a kind to running."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND status = 'queued' ORDER BY created LIMIT 1",
+                (kind,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, updated = ? WHERE id = ?",
+                (os.getpid(), time.time(), row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get_job(row["id"])
+
+    def update_job(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None):
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, result = COALESCE(?, result), worker = ?, updated = ? WHERE id = ?",
+            (status, json_codec.dumps(result) if result is not None else None, os.getpid(), time.time(), job_id),
+        )
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json_codec.loads(job["payload"]) if job["payload"] else None
+        job["result"] = json_codec.loads(job["result"]) if job["result"] else None
+        return job
+
+
+    def append_job_event(self, job_id: str, seq: int, message: Dict[str, Any]):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO job_events (job_id, seq, data) VALUES (?, ?, ?)",
+            (job_id, seq, json_codec.dumps(message)),
+        )
+
+    def job_events(self, job_id: str, after: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        rows = self._conn().execute(
+            "SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after),
+        ).fetchall()
+        return [(row["seq"], json_codec.loads(row["data"])) for row in rows]
+
+    def fail_running_job(self, job_id: str, message: Dict[str, Any]) -> bool:
+        """
+        Fail a running job on behalf of an owner that stopped.
+
+        The message is appended as the job's final event. Returns False if
+        the job had already finished.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            failed = conn.execute(
+                "UPDATE jobs SET status = 'failed', result = ?, updated = ? WHERE id = ? AND status = 'running'",
+                (json_codec.dumps(message), time.time(), job_id),
+            ).rowcount
+            if failed:
+                conn.execute(
+                    "INSERT INTO job_events (job_id, seq, data) "
+                    "SELECT ?, COALESCE(MAX(seq), 0) + 1, ? FROM job_events WHERE job_id = ?",
+                    (job_id, json_codec.dumps(message), job_id),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return bool(failed)
+
+    def purge_jobs(self, kind: str, finished_before: float):
+        """Delete finished jobs of a kind, and their events, last updated before a time."""
+        conn = self._conn()
+        conn.execute(
+            "DELETE FROM job_events WHERE job_id IN "
+            "(SELECT id FROM jobs WHERE kind = ? AND status NOT IN ('queued', 'running') AND updated < ?)",
+            (kind, finished_before),
+        )
+        conn.execute(
+            "DELETE FROM jobs WHERE kind = ? AND status NOT IN ('queued', 'running') AND updated < ?",
+            (kind, finished_before),
+        )
+
+
+_store: Optional[StateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> StateStore:
+    """Get the process-wide state store, creating it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = StateStore()
+    return _store
@@ -0,0 +1,22 @@
+"""
+ASGI entry point for load testing: the real API with a fake LLM.
+
+    uvicorn perf.fake_app:app --workers 4
+
+Fake LLM behaviour is configured through FAKE_LLM_LATENCY_MS,
+FAKE_LLM_TOKENS and FAKE_LLM_TOKEN_MS. Point MASUMI_API_URL at a
+FakeMasumiServer to keep payment checks local.
+"""
+from typing import Optional
+
+import backend.app
+from backend.crew_orchestrator import PolicyAnalysisCrew
+from perf.fake_llm import FakeLLM
+
+
+def get_fake_policy_crew(api_key: Optional[str] = None, provider: str = "openai"):
+    return PolicyAnalysisCrew(llm=FakeLLM())
+
+
+backend.app.get_policy_crew = get_fake_policy_crew
+app = backend.app.app
@@ -0,0 +1,61 @@
+import hashlib
+import os
+import time
+from typing import Any, Dict, List
+
+from crewai import LLM
+
+# Defaults can be overridden per process through the environment so that
+# uvicorn workers started by the load test pick up the same settings.
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "200"))
+FAKE_LLM_TOKEN_MS = float(os.getenv("FAKE_LLM_TOKEN_MS", "0"))
+FAKE_LLM_TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "256"))
+
+_VOCABULARY = [
+    "access", "control", "policy", "audit", "logging", "encryption", "incident",
+    "response", "backup", "recovery", "consent", "retention", "authentication",
+    "mfa", "review", "least", "privilege", "monitoring", "risk", "compliance",
+]
+
+
+class FakeLLM(LLM):
+    """
+    Deterministic stand-in for the crew LLM used by the offline load test.
+
+    The same prompt always yields the same answer. Each call sleeps for a
+    fixed latency plus a per-token delay to approximate a remote model.
+    """
+
+    def __init__(self, latency_ms: float = FAKE_LLM_LATENCY_MS,
+                 tokens: int = FAKE_LLM_TOKENS,
+                 token_ms: float = FAKE_LLM_TOKEN_MS):
+        super().__init__(model="fake/deterministic", temperature=0)
+        self.latency_ms = latency_ms
+        self.tokens = tokens
+        self.token_ms = token_ms
+        self.calls = 0
+
+    def call(self, messages: List[Dict[str, str]], callbacks: List[Any] = []) -> str:
+        self.calls += 1
+        prompt = "".join(str(m.get("content", "")) for m in messages)
+        seed = hashlib.sha256(prompt.encode("utf-8")).digest()
+
+        words = [
+            _VOCABULARY[seed[i % len(seed)] % len(_VOCABULARY)]
+            for i in range(self.tokens)
+        ]
+
+        delay = (self.latency_ms + self.token_ms * self.tokens) / 1000.0
+        if delay > 0:
+            time.sleep(delay)
+
+        return "Thought: I now can give a great answer\nFinal Answer: " + " ".join(words)
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def supports_stop_words(self) -> bool:
+        return False
+
+    def get_context_window_size(self) -> int:
+        return 128000
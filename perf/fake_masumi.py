@@ -0,0 +1,67 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class FakeMasumiServer:
+    """
+    Local stub of the Masumi payment API.
+
+    Answers ``GET /payment/{payment_id}`` with a fixed status so that
+    ``verify_payment`` runs its real HTTP path without touching the network.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 status: str = "CONFIRMED", latency_ms: float = 0.0):
+        self.status = status
+        self.latency_ms = latency_ms
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+
+                if stub.latency_ms:
+                    time.sleep(stub.latency_ms / 1000.0)
+
+                if not self.path.startswith("/payment/"):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                payment_id = self.path[len("/payment/"):]
+                body = json.dumps({"payment_id": payment_id, "status": stub.status}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeMasumiServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
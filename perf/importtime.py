@@ -0,0 +1,95 @@
+"""
+Cold-start benchmark for the API process based on ``python -X importtime``.
+
+    python -m perf.importtime --runs 5 --max-ms 1500
+
+Imports the target module in fresh interpreters, reports the median
+cumulative import time, the slowest top-level imports and whether any
+heavy agent/LLM module was pulled in. Exits non-zero when the median
+exceeds --max-ms or a heavy module is imported, so it can gate CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be loaded on the first analysis
+HEAVY_MODULES = ["crewai", "langchain_openai", "langchain_google_genai", "litellm"]
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """Parse ``-X importtime`` output into (module, self_us, cumulative_us) rows."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure(module: str) -> Dict:
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    rows = parse_importtime(proc.stderr)
+    target = next(row for row in reversed(rows) if row[0].strip() == module)
+    # Each nesting level adds two spaces after the separator; level 1 holds
+    # the modules imported directly by the target.
+    top_level = [(name.strip(), cumulative) for name, _, cumulative in rows
+                 if (len(name) - len(name.lstrip()) - 1) // 2 == 1]
+    loaded = {name.strip().split(".")[0] for name, _, _ in rows}
+
+    return {
+        "total_ms": target[2] / 1000.0,
+        "top_level": top_level,
+        "heavy_loaded": sorted(m for m in HEAVY_MODULES if m in loaded),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure API cold-start import time")
+    parser.add_argument("--module", default="backend.app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list")
+    parser.add_argument("--max-ms", type=float, help="Fail if the median import time exceeds this")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    totals = [run["total_ms"] for run in runs]
+    slowest = sorted(runs[-1]["top_level"], key=lambda row: row[1], reverse=True)[:args.top]
+
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "median_ms": round(statistics.median(totals), 1),
+        "min_ms": round(min(totals), 1),
+        "max_ms": round(max(totals), 1),
+        "slowest_imports_ms": {name: round(us / 1000.0, 1) for name, us in slowest},
+        "heavy_modules_loaded": runs[-1]["heavy_loaded"],
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = bool(report["heavy_modules_loaded"])
+    if args.max_ms is not None and report["median_ms"] > args.max_ms:
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
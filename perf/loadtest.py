@@ -0,0 +1,307 @@
+"""
+Offline end-to-end load test for the analysis API.
+
+Starts a stub Masumi payment server, launches the real FastAPI app under
+uvicorn with a deterministic fake LLM (see perf/fake_app.py) and drives
+/analyze_policy/ and /analyze_policy_stream/ at a fixed concurrency. No
+API credits are spent and no traffic leaves the machine.
+
+    python -m perf.loadtest --requests 200 --concurrency 20 --workers 4
+    python -m perf.loadtest --requests 200 --repeat-document
+
+Every request uploads a distinct document (the policy plus a numbered
+line), so each one runs a full analysis instead of being answered from
+the result cache or joined to an identical run in progress. Pass
+--repeat-document to send identical bytes and measure the cached and
+coalesced path instead. The server uses a throwaway state store and
+reports directory, so results never reach the production database.
+
+Reports throughput, p50/p95/p99 latency and peak RSS per worker process.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from perf.fake_masumi import FakeMasumiServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _read_rss_kb(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _child_pids(pid: int) -> List[int]:
+    children = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+class MemorySampler:
+    """Samples peak RSS of the server process and its worker processes."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb: Dict[int, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            for pid in [self.pid] + _child_pids(self.pid):
+                rss = _read_rss_kb(pid)
+                if rss is not None and rss > self.peak_kb.get(pid, 0):
+                    self.peak_kb[pid] = rss
+            self._stop.wait(self.interval)
+
+    def start(self) -> "MemorySampler":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def start_server(args, masumi_url: str, state_dir: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "MASUMI_API_URL": masumi_url,
+        # Keep results, index, history and reports out of the real store
+        "STATE_DB_PATH": os.path.join(state_dir, "state.db"),
+        "REPORTS_DIR": os.path.join(state_dir, "reports"),
+        "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "FAKE_LLM_TOKENS": str(args.llm_tokens),
+        "FAKE_LLM_TOKEN_MS": str(args.llm_token_ms),
+        "PYTHONPATH": ROOT_DIR + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    # All load comes from one client IP; measure capacity, not per-tenant limits
+    env.setdefault("RATE_LIMIT_PER_MINUTE", "0")
+    env.setdefault("PREMIUM_RATE_LIMIT_PER_MINUTE", "0")
+    env.setdefault("MAX_QUEUED_PER_TENANT", str(args.requests))
+    # Nothing may leave the machine: no model price list download, no telemetry
+    env.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+    env.setdefault("OTEL_SDK_DISABLED", "true")
+    env.setdefault("CREWAI_TELEMETRY_OPT_OUT", "true")
+    cmd = [
+        sys.executable, "-m", "uvicorn", "perf.fake_app:app",
+        "--host", "127.0.0.1",
+        "--port", str(args.port),
+        "--workers", str(args.workers),
+        "--log-level", "warning",
+    ]
+    return subprocess.Popen(
+        cmd, cwd=ROOT_DIR, env=env,
+        stdout=subprocess.DEVNULL if not args.server_output else None,
+    )
+
+
+async def wait_until_ready(base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                resp = await client.get(f"{base_url}/health")
+                if resp.status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready in {timeout}s")
+
+
+async def run_one(client: httpx.AsyncClient, base_url: str, endpoint: str,
+                  policy: bytes, premium: bool, index: int, repeat_document: bool) -> Dict:
+    data = {"premium": "true" if premium else "false"}
+    if not repeat_document:
+        # A distinct document per request defeats the result cache and coalescing
+        policy += f"\n\nLoad test document {index}\n".encode()
+    if premium:
+        data["payment_id"] = f"LOAD_{index}"
+    files = {"file": ("policy.txt", policy, "text/plain")}
+
+    start = time.perf_counter()
+    first_event = None
+    ok = False
+    status = 0
+
+    try:
+        if endpoint == "stream":
+            async with client.stream("POST", f"{base_url}/analyze_policy_stream/",
+                                     data=data, files=files) as resp:
+                status = resp.status_code
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    if first_event is None:
+                        first_event = time.perf_counter() - start
+                    message = json.loads(line[6:])
+                    if message.get("error"):
+                        break
+                    if message.get("complete"):
+                        ok = bool((message.get("result") or {}).get("success"))
+                        break
+        else:
+            resp = await client.post(f"{base_url}/analyze_policy/", data=data, files=files)
+            status = resp.status_code
+            ok = status == 200 and resp.json().get("success", False)
+    except httpx.HTTPError:
+        ok = False
+
+    return {
+        "endpoint": endpoint,
+        "premium": premium,
+        "status": status,
+        "ok": ok,
+        "latency": time.perf_counter() - start,
+        "first_event": first_event,
+    }
+
+
+async def drive(args, base_url: str, policy: bytes) -> List[Dict]:
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    timeout = httpx.Timeout(args.request_timeout)
+    limits = httpx.Limits(max_connections=args.concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def bounded(index: int):
+            endpoint = args.endpoint
+            if endpoint == "mixed":
+                endpoint = "stream" if rng.random() < 0.5 else "json"
+            premium = rng.random() < args.premium_ratio
+            async with semaphore:
+                return await run_one(client, base_url, endpoint, policy, premium, index,
+                                     args.repeat_document)
+
+        return await asyncio.gather(*(bounded(i) for i in range(args.requests)))
+
+
+def summarize(results: List[Dict], elapsed: float, memory: Dict[int, int],
+              server_pid: int, masumi_requests: int) -> Dict:
+    latencies = [r["latency"] for r in results if r["ok"]]
+    first_events = [r["first_event"] for r in results if r["first_event"] is not None]
+    errors = [r for r in results if not r["ok"]]
+
+    return {
+        "requests": len(results),
+        "succeeded": len(latencies),
+        "failed": len(errors),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1) if latencies else 0.0,
+        },
+        "stream_first_event_ms_p50": round(percentile(first_events, 50) * 1000, 1),
+        "error_statuses": sorted({r["status"] for r in errors}),
+        "masumi_requests": masumi_requests,
+        "peak_rss_mb": {
+            ("master" if pid == server_pid else str(pid)): round(kb / 1024, 1)
+            for pid, kb in sorted(memory.items())
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the ADA policy analyzer API")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--endpoint", choices=["json", "stream", "mixed"], default="json")
+    parser.add_argument("--premium-ratio", type=float, default=0.0,
+                        help="Fraction of requests sent as premium (exercises payment verification)")
+    parser.add_argument("--policy", default=os.path.join(ROOT_DIR, "sample_policy.txt"))
+    parser.add_argument("--repeat-document", action="store_true",
+                        help="Send identical bytes in every request (measures cache hits and coalescing)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--llm-tokens", type=int, default=256)
+    parser.add_argument("--llm-token-ms", type=float, default=0.0)
+    parser.add_argument("--masumi-latency-ms", type=float, default=20.0)
+    parser.add_argument("--request-timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--server-output", action="store_true", help="Show server stdout")
+    args = parser.parse_args(argv)
+
+    with open(args.policy, "rb") as f:
+        policy = f.read()
+
+    state_dir = tempfile.mkdtemp(prefix="ada-loadtest-")
+    masumi = FakeMasumiServer(latency_ms=args.masumi_latency_ms).start()
+    server = start_server(args, masumi.url, state_dir)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        asyncio.run(wait_until_ready(base_url))
+        sampler = MemorySampler(server.pid).start()
+
+        start = time.perf_counter()
+        results = asyncio.run(drive(args, base_url, policy))
+        elapsed = time.perf_counter() - start
+
+        sampler.stop()
+        report = summarize(results, elapsed, sampler.peak_kb, server.pid, masumi.requests)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        masumi.stop()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return 0 if report["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
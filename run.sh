@@ -1,3 +1,8 @@
 #!/bin/bash
 echo "Starting Live Data Analysis by Masumi (ADA)..."
-uvicorn backend.app:app --reload
+if [ "$1" = "prod" ]; then
+    # Multi-worker mode: WEB_CONCURRENCY workers sharing state via SQLite
+    exec gunicorn backend.app:app -c backend/gunicorn_conf.py
+else
+    uvicorn backend.app:app --reload
+fi